@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+واجهة سطر الأوامر لنظام صيانة الأجهزة الطبية (بدون Streamlit)
+Medical Equipment Maintenance - command line / batch entry point
+
+أمثلة:
+    python -m maintenance_cli report -o report.xlsx
+    python -m maintenance_cli report --all-centers -o centers.zip
+    python -m maintenance_cli overdue --days 7 -o overdue.xlsx
+    python -m maintenance_cli plan --technicians 6 --days 30 -o plan.xlsx
+    python -m maintenance_cli routes --distances center_distances.csv
+    python -m maintenance_cli route-benchmark --sizes 1000 10000 50000
+    python -m maintenance_cli import All_Devices_Merged.xlsx
+    python -m maintenance_cli export backup.parquet
+    python -m maintenance_cli importtime
+"""
+
+import argparse
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from maintenance_core import (
+    DATA_FILE, DERIVED_COLUMNS, DISTANCES_FILE, ReportJobQueue, RoutePlanner, VisitPlanner,
+    center_reports_job, compute_maintenance_status, daily_load, day_end, get_store, import_profile,
+    load_devices, load_distances, prepare_data, synthetic_distances, synthetic_fleet,
+    write_maintenance_report
+)
+
+def write_devices(df, output):
+    """كتابة جدول أجهزة إلى ملف Excel أو CSV حسب الامتداد"""
+    if output.lower().endswith('.csv'):
+        df.to_csv(output, index=False, encoding='utf-8-sig')
+    else:
+        write_maintenance_report(df, output)
+
+def cmd_report(args):
+    """تقرير الصيانة الشامل، أو لمركز واحد، أو لكل المراكز في ZIP"""
+    df = load_devices(args.data)
+    if args.all_centers:
+        queue = ReportJobQueue()
+        data = queue.result(queue.submit("تقارير المراكز", *center_reports_job(df)))
+        with open(args.output, 'wb') as f:
+            f.write(data)
+    else:
+        write_maintenance_report(df, args.output, args.center)
+    print(f"تم حفظ التقرير: {args.output}")
+    return 0
+
+def cmd_overdue(args):
+    """الأجهزة المتأخرة أو المستحقة خلال عدد من الأيام"""
+    df = load_devices(args.data)
+    if args.center:
+        df = df[df['Center_Name'] == args.center]
+
+    # المستحق اليوم متأخر كما في compute_maintenance_status
+    due_by = day_end() + pd.Timedelta(days=args.days)
+    overdue = df[df['Next_Maintenance'] < due_by]
+
+    if args.output:
+        write_devices(overdue, args.output)
+        print(f"تم حفظ {len(overdue)} جهاز: {args.output}")
+    else:
+        statuses = compute_maintenance_status(overdue)['Maintenance_Status']
+        summary = pd.crosstab(overdue['Center_Name'], statuses)
+        print(summary.to_string() if len(summary) else "لا توجد أجهزة مستحقة")
+        print(f"الإجمالي: {len(overdue)}")
+    return 0
+
+def cmd_plan(args):
+    """خطة زيارات الفنيين للأجهزة المستحقة خلال مدة الخطة"""
+    df = load_devices(args.data)
+    planner = VisitPlanner(args.technicians, args.per_technician, args.early, holidays=args.holiday)
+    plan = planner.plan(df, horizon_days=args.days)
+    if args.output:
+        write_devices(plan, args.output)
+        print(f"تم حفظ خطة {len(plan)} جهاز: {args.output}")
+    else:
+        print(daily_load(plan).to_string() if plan['Planned_Date'].notna().any() else "لا توجد أجهزة مستحقة")
+        print(f"بعد المهلة: {int(plan['Late'].sum())} / خارج الخطة: {int(plan['Planned_Date'].isna().sum())}")
+    return 0
+
+def cmd_routes(args):
+    """مسارات الفنيين اليومية بين المراكز حسب مصفوفة المسافات"""
+    df = load_devices(args.data)
+    planner = RoutePlanner(
+        load_distances(args.distances), args.technicians, args.per_technician, args.early,
+        holidays=args.holiday, max_route_km=args.max_km
+    )
+    plan = planner.plan(df, horizon_days=args.days)
+    if args.output:
+        write_devices(plan, args.output)
+        print(f"تم حفظ مسارات {len(plan)} جهاز: {args.output}")
+    else:
+        routes = planner.summary(plan)
+        print(routes.to_string(index=False) if len(routes) else "لا توجد أجهزة مستحقة")
+        print(f"المسافة: {routes['Distance_km'].sum():.0f} كم / بعد المهلة: {int(plan['Late'].sum())}"
+              f" / خارج الخطة: {int(plan['Planned_Date'].isna().sum())}")
+    return 0
+
+def cmd_route_benchmark(args):
+    """مقارنة مخطط المسارات بخطة زيارة مركز واحد لكل فني على أساطيل تجريبية"""
+    distances = synthetic_distances(seed=args.seed)
+    measure = RoutePlanner(distances)
+    results = []
+    for size in args.sizes:
+        fleet = synthetic_fleet(size, seed=args.seed)
+        technicians = args.technicians or max(2, size // 250)
+        for name, planner in [
+            ('routes', RoutePlanner(distances, technicians, args.per_technician)),
+            ('visits', VisitPlanner(technicians, args.per_technician)),
+        ]:
+            started = time.perf_counter()
+            plan = planner.plan(fleet, horizon_days=args.days)
+            elapsed = time.perf_counter() - started
+            routes = measure.summary(plan)
+            results.append({
+                'Fleet': size,
+                'Technicians': technicians,
+                'Planner': name,
+                'Seconds': round(elapsed, 2),
+                'Due': len(plan),
+                'Planned': int(plan['Planned_Date'].notna().sum()),
+                'Late': int(plan['Late'].sum()),
+                'Routes': len(routes),
+                'Distance_km': round(routes['Distance_km'].sum()),
+            })
+    print(pd.DataFrame(results).to_string(index=False))
+    return 0
+
+def cmd_import(args):
+    """استيراد ملف أجهزة (Excel / Parquet / Feather) إلى المخزن بدلاً من بياناته"""
+    df = prepare_data(get_store(args.source).read())
+    get_store(args.data).write(df.drop(columns=DERIVED_COLUMNS))
+    print(f"تم استيراد {len(df)} جهاز إلى {args.data}")
+    return 0
+
+def cmd_export(args):
+    """تصدير بيانات المخزن إلى ملف (Excel / Parquet / Feather / SQLite)"""
+    df = load_devices(args.data)
+    get_store(args.destination).write(df.drop(columns=DERIVED_COLUMNS))
+    print(f"تم تصدير {len(df)} جهاز إلى {args.destination}")
+    return 0
+
+def cmd_importtime(args):
+    """زمن استيراد الوحدات لتشخيص بطء بدء التشغيل"""
+    print(import_profile(args.modules, args.top).to_string(index=False))
+    return 0
+
+def add_plan_arguments(parser):
+    parser.add_argument('--technicians', type=int, default=4, help="عدد الفنيين")
+    parser.add_argument('--per-technician', type=int, default=8, help="أجهزة لكل فني يومياً")
+    parser.add_argument('--days', type=int, default=30, help="مدة الخطة بالأيام")
+    parser.add_argument('--early', type=int, default=7, help="أقصى زيارة مبكرة قبل الموعد (أيام)")
+    parser.add_argument('--holiday', action='append', default=[], help="إجازة رسمية YYYY-MM-DD (تتكرر)")
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='maintenance_cli',
+        description="أوامر نظام صيانة الأجهزة الطبية بدون واجهة"
+    )
+    parser.add_argument('--data', default=DATA_FILE, help="مخزن البيانات (افتراضياً قاعدة SQLite)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    today = datetime.now().strftime('%Y%m%d')
+
+    report = commands.add_parser('report', help="تقرير الصيانة")
+    report.add_argument('-o', '--output', default=f"maintenance_report_{today}.xlsx")
+    scope = report.add_mutually_exclusive_group()
+    scope.add_argument('--center', help="اسم المركز")
+    scope.add_argument('--all-centers', action='store_true', help="تقرير لكل مركز في ملف ZIP")
+    report.set_defaults(handler=cmd_report)
+
+    overdue = commands.add_parser('overdue', help="الصيانات المتأخرة")
+    overdue.add_argument('--days', type=int, default=0, help="تضمين المستحق خلال هذه الأيام")
+    overdue.add_argument('--center', help="اسم المركز")
+    overdue.add_argument('-o', '--output', help="ملف xlsx أو csv (وإلا يُطبع ملخص)")
+    overdue.set_defaults(handler=cmd_overdue)
+
+    plan = commands.add_parser('plan', help="خطة زيارات الفنيين")
+    add_plan_arguments(plan)
+    plan.add_argument('-o', '--output', help="ملف xlsx أو csv (وإلا يُطبع ملخص يومي)")
+    plan.set_defaults(handler=cmd_plan)
+
+    routes = commands.add_parser('routes', help="مسارات الفنيين بين المراكز")
+    add_plan_arguments(routes)
+    routes.add_argument('--distances', default=DISTANCES_FILE, help="ملف CSV لمصفوفة المسافات بين رموز المراكز")
+    routes.add_argument('--max-km', type=float, help="أقصى مسافة للمسار اليومي")
+    routes.add_argument('-o', '--output', help="ملف xlsx أو csv (وإلا يُطبع ملخص المسارات)")
+    routes.set_defaults(handler=cmd_routes)
+
+    benchmark = commands.add_parser('route-benchmark', help="قياس مخطط المسارات على أساطيل تجريبية")
+    benchmark.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    benchmark.add_argument('--technicians', type=int, help="عدد الفنيين (افتراضياً فني لكل 250 جهاز)")
+    benchmark.add_argument('--per-technician', type=int, default=12)
+    benchmark.add_argument('--days', type=int, default=30)
+    benchmark.add_argument('--seed', type=int, default=0)
+    benchmark.set_defaults(handler=cmd_route_benchmark)
+
+    import_ = commands.add_parser('import', help="استيراد ملف أجهزة إلى المخزن")
+    import_.add_argument('source')
+    import_.set_defaults(handler=cmd_import)
+
+    export = commands.add_parser('export', help="تصدير المخزن إلى ملف")
+    export.add_argument('destination')
+    export.set_defaults(handler=cmd_export)
+
+    importtime = commands.add_parser('importtime', help="زمن استيراد الوحدات")
+    importtime.add_argument('modules', nargs='*', default=['maintenance_cli'])
+    importtime.add_argument('--top', type=int, default=20)
+    importtime.set_defaults(handler=cmd_importtime)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.handler(args)
+    except Exception as e:
+        print(f"خطأ: {e}", file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2082 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+نواة نظام إدارة صيانة الأجهزة الطبية (بدون واجهة)
+Medical Equipment Maintenance - core data, storage and reports
+
+لا تستورد Streamlit، لذا يمكن استخدامها من عمليات الخلفية ومن المهام المجدولة.
+"""
+
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from io import BytesIO
+import fnmatch
+import functools
+import hashlib
+import multiprocessing
+import operator
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import unicodedata
+import uuid
+import zipfile
+
+# --- قائمة المراكز الصحية ---
+CENTERS = [
+    ("الخلاوية", "KHL-PHC"), ("جبل القهر", "GQH-PHC"), ("مقزع", "MQZ-PHC"),
+    ("القوام", "QWM-PHC"), ("الجبل الأسود", "BLM-PHC"), ("السادة", "SAD-PHC"),
+    ("بيش الشمالي", "NBS-PHC"), ("قرية بيش", "VBS-PHC"), ("المحلة", "MHL-PHC"),
+    ("العشة", "ASH-PHC"), ("أبو السداد", "ASD-PHC"), ("العالية", "ALA-PHC"),
+    ("السلامة", "SAL-PHC"), ("مسلية", "MSL-PHC"), ("عتود", "ATD-PHC"),
+    ("الفطيحة", "FTH-PHC"), ("منشبة", "MNS-PHC"), ("قايم الدش", "QDS-PHC"),
+    ("المطعن", "MTN-PHC"), ("الحقو", "HAQ-PHC"), ("الريث", "RYT-PHC"),
+    ("الشقيق", "SHQ-PHC"), ("الدرب", "DRB-PHC"), ("بيش الجنوبي", "SBS-PHC"),
+    ("عمود", "AMD-PHC")
+]
+
+CENTERS_DICT = {code: name for name, code in CENTERS}
+CENTERS_DICT_REV = {name: code for name, code in CENTERS}
+
+# --- مسارات البيانات ---
+# قاعدة SQLite هي المخزن الأساسي، وملفات Parquet و Excel للاستيراد والتصدير
+DATA_DIR = '/mnt/user-data/uploads'
+EXCEL_FILE = os.path.join(DATA_DIR, 'All_Devices_Merged.xlsx')
+PARQUET_FILE = os.path.join(DATA_DIR, 'All_Devices_Merged.parquet')
+DATA_FILE = os.path.join(DATA_DIR, 'medical_maintenance.db')
+# مصادر الاستيراد عند أول تشغيل حسب الأولوية
+IMPORT_SOURCES = [PARQUET_FILE, EXCEL_FILE]
+
+# أعمدة محسوبة عند التحميل ولا تُحفظ
+DERIVED_COLUMNS = ['Center_Code', 'Center_Name']
+
+# --- مخطط أنواع الأعمدة ---
+# يُطبَّق عند التحميل: فئات للنصوص قليلة التنوع، int16 للفترات، وتواريخ
+DATE_COLUMNS = ['Installation Date', 'Last_Maintenance', 'Next_Maintenance']
+INT16_COLUMNS = ['Maintenance_Interval_Days']
+# الأعمدة التصنيفية وقيمها المعروفة (None = تُستنتج من البيانات)
+CATEGORICAL_COLUMNS = {
+    'Center_Code': [code for _, code in CENTERS],
+    'Center_Name': [name for name, _ in CENTERS],
+    'Scientific Department': None,
+    'Device_Status': ['عامل', 'معطل', 'تحت الصيانة'],
+    'Priority': ['عالي', 'متوسط', 'منخفض'],
+    'Manufacturer': None,
+}
+
+# --- التخزين ---
+class ExcelStore:
+    """تخزين بصيغة Excel (استيراد وتصدير)"""
+    
+    def __init__(self, path):
+        self.path = path
+    
+    def exists(self):
+        return os.path.exists(self.path)
+    
+    def read(self):
+        return pd.read_excel(self.path)
+    
+    def write(self, df):
+        df.to_excel(self.path, index=False)
+
+class ParquetStore(ExcelStore):
+    """تخزين عمودي بصيغة Parquet مع أعمدة تواريخ وأعمدة تصنيفية"""
+    
+    def read(self):
+        return pd.read_parquet(self.path)
+    
+    def write(self, df):
+        df = to_storage_types(df)
+        # الكتابة في ملف مؤقت ثم الاستبدال حتى لا يتلف الملف عند الانقطاع
+        tmp_path = f"{self.path}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+
+class FeatherStore(ParquetStore):
+    """تخزين عمودي بصيغة Arrow IPC (Feather)"""
+    
+    def read(self):
+        return pd.read_feather(self.path)
+    
+    def write(self, df):
+        df = to_storage_types(df).reset_index(drop=True)
+        tmp_path = f"{self.path}.tmp"
+        df.to_feather(tmp_path)
+        os.replace(tmp_path, self.path)
+
+# أعمدة جدول الأجهزة في قاعدة البيانات
+DEVICE_COLUMNS = {
+    'Asset ID': 'TEXT NOT NULL',
+    'Scientific Department': 'TEXT',
+    'Scientific Equipment Name': 'TEXT',
+    'Manufacturer': 'TEXT',
+    'Model': 'TEXT',
+    'Serial No': 'TEXT',
+    'PPM Done': 'TEXT',
+    'Installation Date': 'TEXT',
+    'Status': 'TEXT',
+    'Center_Code': 'TEXT',
+    'Last_Maintenance': 'TEXT',
+    'Next_Maintenance': 'TEXT',
+    'Maintenance_Interval_Days': 'INTEGER',
+    'Device_Status': 'TEXT',
+    'Priority': 'TEXT',
+    'Notes': 'TEXT',
+}
+DEVICE_INDEXES = ['Center_Code', 'Next_Maintenance', 'Device_Status']
+
+# سجل الصيانة: جدول إلحاق فقط (لا تعديل ولا حذف)
+EVENT_COLUMNS = {
+    'Asset ID': 'TEXT NOT NULL',
+    'Maintenance_Date': 'TEXT',
+    'Maintenance_Type': 'TEXT',
+    'Technician': 'TEXT',
+    'Parts_Replaced': 'TEXT',
+    'Notes': 'TEXT',
+    'Status_After': 'TEXT',
+    'Recorded_At': 'TEXT',
+}
+
+# قواعد سياسة الصيانة (الحقل الفارغ يطابق أي قيمة)
+POLICY_COLUMNS = {
+    'Name_Pattern': 'TEXT',
+    'Department': 'TEXT',
+    'Priority': 'TEXT',
+    'Interval_Days': 'INTEGER NOT NULL',
+}
+
+def format_asset_id(center_code, number):
+    """Asset ID بالشكل CODE-PHC-001 (يتسع تلقائياً بعد 999 جهاز)"""
+    return f"{center_code}-{number:03d}"
+
+def parse_asset_number(asset_id):
+    """الرقم التسلسلي من Asset ID أو None"""
+    try:
+        return int(str(asset_id).rsplit('-', 1)[-1])
+    except ValueError:
+        return None
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def _to_sql_value(value):
+    """تحويل قيمة من pandas إلى قيمة تقبلها SQLite"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return pd.Timestamp(value).isoformat(sep=' ')
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+class DeviceRepository:
+    """مستودع الأجهزة في قاعدة SQLite مع كتابة على مستوى الصف
+    
+    كل عملية إضافة أو تعديل أو حذف تمس صفاً واحداً فقط بدلاً من
+    إعادة كتابة الملف كاملاً. الاتصال مشترك بين الجلسات ومحمي بقفل.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+    
+    def _create_schema(self):
+        columns = ', '.join(f"{_quote(col)} {sql_type}" for col, sql_type in DEVICE_COLUMNS.items())
+        with self._lock, self.conn:
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS devices ({columns})")
+            for col in DEVICE_INDEXES:
+                index_name = 'idx_devices_' + col.lower().replace(' ', '_')
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON devices ({_quote(col)})")
+            
+            # Asset ID فريد لكل جهاز (يحل محل الفهرس غير الفريد في القواعد السابقة)
+            self.conn.execute("DROP INDEX IF EXISTS idx_devices_asset_id")
+            try:
+                self.conn.execute(
+                    f"CREATE UNIQUE INDEX IF NOT EXISTS uq_devices_asset_id ON devices ({_quote('Asset ID')})"
+                )
+            except sqlite3.IntegrityError:
+                raise ValueError("توجد أرقام Asset ID مكررة في قاعدة البيانات")
+            
+            event_columns = ', '.join(f"{_quote(col)} {sql_type}" for col, sql_type in EVENT_COLUMNS.items())
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS maintenance_events "
+                f"(Event_ID INTEGER PRIMARY KEY AUTOINCREMENT, {event_columns})"
+            )
+            self.conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_events_asset_date "
+                f"ON maintenance_events ({_quote('Asset ID')}, Maintenance_Date)"
+            )
+            
+            # آخر رقم محجوز لكل مركز
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS asset_sequences "
+                "(Center_Code TEXT PRIMARY KEY, Last_Number INTEGER NOT NULL)"
+            )
+            
+            policy_columns = ', '.join(f"{_quote(col)} {sql_type}" for col, sql_type in POLICY_COLUMNS.items())
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS maintenance_policy "
+                f"(Rule_Order INTEGER PRIMARY KEY, {policy_columns})"
+            )
+    
+    def _row_values(self, record):
+        record = dict(record)
+        if not record.get('Center_Code') and record.get('Asset ID'):
+            record['Center_Code'] = '-'.join(str(record['Asset ID']).split('-')[0:2])
+        return [_to_sql_value(record.get(col)) for col in DEVICE_COLUMNS]
+    
+    def exists(self):
+        return self.count() > 0
+    
+    def count(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM devices").fetchone()[0]
+    
+    def read(self):
+        """قراءة جميع الأجهزة كـ DataFrame"""
+        with self._lock:
+            df = pd.read_sql_query("SELECT * FROM devices ORDER BY rowid", self.conn)
+        for col in DATE_COLUMNS:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+        return df
+    
+    def write(self, df):
+        """استبدال جميع الأجهزة (للاستيراد والاستعادة فقط)"""
+        duplicates = df.loc[df['Asset ID'].duplicated(), 'Asset ID'].unique()
+        if len(duplicates) > 0:
+            raise ValueError(f"أرقام Asset ID مكررة: {', '.join(map(str, duplicates[:10]))}")
+        rows = [self._row_values(record) for record in df.to_dict('records')]
+        placeholders = ', '.join('?' for _ in DEVICE_COLUMNS)
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM devices")
+            self.conn.executemany(f"INSERT INTO devices VALUES ({placeholders})", rows)
+            # تُعاد تهيئة التسلسلات من البيانات الجديدة عند أول حجز
+            self.conn.execute("DELETE FROM asset_sequences")
+    
+    def get(self, asset_id):
+        """قراءة جهاز واحد كقاموس أو None"""
+        with self._lock:
+            cursor = self.conn.execute(
+                f"SELECT * FROM devices WHERE {_quote('Asset ID')} = ?", (asset_id,)
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([d[0] for d in cursor.description], row))
+    
+    def next_asset_id(self, center_code):
+        """حجز رقم Asset ID التالي للمركز
+        
+        الحجز داخل معاملة BEGIN IMMEDIATE، فلا يحصل مستخدمان (ولا عمليتان)
+        على الرقم نفسه. يبدأ التسلسل من أكبر رقم موجود في بيانات المركز.
+        """
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT Last_Number FROM asset_sequences WHERE Center_Code = ?", (center_code,)
+                ).fetchone()
+                if row is None:
+                    asset_ids = self.conn.execute(
+                        f"SELECT {_quote('Asset ID')} FROM devices WHERE Center_Code = ?", (center_code,)
+                    ).fetchall()
+                    numbers = [parse_asset_number(asset_id) for (asset_id,) in asset_ids]
+                    last_number = max([n for n in numbers if n is not None], default=0)
+                else:
+                    last_number = row[0]
+                
+                self.conn.execute(
+                    "INSERT INTO asset_sequences VALUES (?, ?) "
+                    "ON CONFLICT(Center_Code) DO UPDATE SET Last_Number = excluded.Last_Number",
+                    (center_code, last_number + 1)
+                )
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        return format_asset_id(center_code, last_number + 1)
+    
+    def add_device(self, record):
+        placeholders = ', '.join('?' for _ in DEVICE_COLUMNS)
+        with self._lock, self.conn:
+            self.conn.execute(f"INSERT INTO devices VALUES ({placeholders})", self._row_values(record))
+    
+    def update_device(self, asset_id, changes):
+        self.update_devices([asset_id], changes)
+    
+    def update_devices(self, asset_ids, changes):
+        """تطبيق نفس التعديلات على مجموعة أجهزة"""
+        with self._lock, self.conn:
+            self._update_devices(asset_ids, changes)
+    
+    def _update_devices(self, asset_ids, changes):
+        columns = [col for col in changes if col in DEVICE_COLUMNS]
+        if not columns:
+            return
+        assignments = ', '.join(f"{_quote(col)} = ?" for col in columns)
+        values = [_to_sql_value(changes[col]) for col in columns]
+        self.conn.executemany(
+            f"UPDATE devices SET {assignments} WHERE {_quote('Asset ID')} = ?",
+            [values + [asset_id] for asset_id in asset_ids]
+        )
+    
+    def save_rows(self, df):
+        """حفظ صفوف معدلة من DataFrame حسب Asset ID (أعمدة df الموجودة فقط)"""
+        columns = [col for col in DEVICE_COLUMNS if col != 'Asset ID' and col in df.columns]
+        assignments = ', '.join(f"{_quote(col)} = ?" for col in columns)
+        rows = [
+            [_to_sql_value(record[col]) for col in columns] + [record['Asset ID']]
+            for record in df.to_dict('records')
+        ]
+        with self._lock, self.conn:
+            self.conn.executemany(
+                f"UPDATE devices SET {assignments} WHERE {_quote('Asset ID')} = ?", rows
+            )
+    
+    def delete_device(self, asset_id):
+        with self._lock, self.conn:
+            self.conn.execute(f"DELETE FROM devices WHERE {_quote('Asset ID')} = ?", (asset_id,))
+    
+    def log_maintenance(self, asset_id, event, changes):
+        """إضافة سجل صيانة وتحديث الجهاز في معاملة واحدة"""
+        event = dict(event, **{'Asset ID': asset_id})
+        event.setdefault('Recorded_At', pd.Timestamp.now())
+        columns = ', '.join(_quote(col) for col in EVENT_COLUMNS)
+        placeholders = ', '.join('?' for _ in EVENT_COLUMNS)
+        values = [_to_sql_value(event.get(col)) for col in EVENT_COLUMNS]
+        with self._lock, self.conn:
+            self.conn.execute(f"INSERT INTO maintenance_events ({columns}) VALUES ({placeholders})", values)
+            self._update_devices([asset_id], changes)
+    
+    def maintenance_history(self, asset_id):
+        """سجل الصيانة لجهاز واحد (الأحدث أولاً)"""
+        columns = ', '.join(_quote(col) for col in EVENT_COLUMNS if col != 'Asset ID')
+        with self._lock:
+            df = pd.read_sql_query(
+                f"SELECT {columns} FROM maintenance_events WHERE {_quote('Asset ID')} = ? "
+                f"ORDER BY Maintenance_Date DESC, Event_ID DESC",
+                self.conn, params=(asset_id,)
+            )
+        df['Maintenance_Date'] = pd.to_datetime(df['Maintenance_Date'], errors='coerce')
+        return df
+    
+    def read_policy(self):
+        """قواعد سياسة الصيانة بترتيب إدخالها"""
+        columns = ', '.join(_quote(col) for col in POLICY_COLUMNS)
+        with self._lock:
+            return pd.read_sql_query(
+                f"SELECT {columns} FROM maintenance_policy ORDER BY Rule_Order", self.conn
+            )
+    
+    def write_policy(self, rules):
+        """استبدال قواعد سياسة الصيانة"""
+        columns = ', '.join(_quote(col) for col in POLICY_COLUMNS)
+        placeholders = ', '.join('?' for _ in POLICY_COLUMNS)
+        rows = [[_to_sql_value(record.get(col)) for col in POLICY_COLUMNS]
+                for record in rules.to_dict('records')]
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM maintenance_policy")
+            self.conn.executemany(
+                f"INSERT INTO maintenance_policy ({columns}) VALUES ({placeholders})", rows
+            )
+
+STORAGE_BACKENDS = {
+    '.db': DeviceRepository,
+    '.sqlite': DeviceRepository,
+    '.xlsx': ExcelStore,
+    '.xls': ExcelStore,
+    '.parquet': ParquetStore,
+    '.feather': FeatherStore,
+    '.arrow': FeatherStore,
+}
+
+def get_store(file_path):
+    """اختيار طريقة التخزين حسب امتداد الملف"""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext not in STORAGE_BACKENDS:
+        raise ValueError(f"صيغة ملف غير مدعومة: {ext}")
+    return STORAGE_BACKENDS[ext](file_path)
+
+def _as_text(series):
+    """تحويل القيم غير الفارغة إلى نص مع إبقاء القيم الفارغة"""
+    return series.where(series.isna(), series.astype(str))
+
+def apply_schema(df):
+    """تطبيق مخطط الأنواع المضغوط على أعمدة الجدول"""
+    for col in df.columns:
+        if col in DATE_COLUMNS:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+        elif col in INT16_COLUMNS:
+            if df[col].notna().all():
+                df[col] = df[col].astype('int16')
+        elif col in CATEGORICAL_COLUMNS and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            values = _as_text(df[col])
+            known = CATEGORICAL_COLUMNS[col] or []
+            extra = sorted(set(values.dropna()) - set(known))
+            df[col] = pd.Categorical(values, categories=known + extra)
+    return df
+
+def to_generic_types(df):
+    """إرجاع الأعمدة إلى الأنواع العامة (object و int64) كما قبل المخطط"""
+    df = df.copy()
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+        elif col in INT16_COLUMNS:
+            df[col] = df[col].astype('int64')
+    return df
+
+def memory_report(df):
+    """استهلاك الذاكرة لكل عمود قبل تطبيق المخطط وبعده (بالكيلوبايت)"""
+    report = pd.DataFrame({
+        'Before_KB': to_generic_types(df).memory_usage(deep=True, index=False) / 1024,
+        'After_KB': df.memory_usage(deep=True, index=False) / 1024,
+    })
+    report.loc['الإجمالي'] = report.sum()
+    report['Saved_%'] = (1 - report['After_KB'] / report['Before_KB']) * 100
+    return report.round(1)
+
+def to_storage_types(df):
+    """تحويل الأعمدة إلى أنواع ثابتة قبل الحفظ العمودي"""
+    df = apply_schema(df.copy())
+    for col in df.columns:
+        if df[col].dtype == object:
+            # أعمدة مختلطة (أرقام ونصوص) مثل Serial No تُحفظ كنص
+            df[col] = _as_text(df[col])
+    return df
+
+def set_values(column, idx, value):
+    """نسخة من العمود بقيمة جديدة للصفوف idx (تُضاف الفئة الجديدة عند الحاجة)"""
+    column = column.copy()
+    if isinstance(column.dtype, pd.CategoricalDtype) and pd.notna(value) \
+            and value not in column.cat.categories:
+        column = column.cat.add_categories([value])
+    column.loc[idx] = value
+    return column
+
+def conform_rows(df, new_rows):
+    """مطابقة أنواع أعمدة صفوف جديدة أو معدلة مع أنواع الجدول
+    
+    يعيد (df, new_rows)، حيث تُوسَّع فئات df عند ظهور قيم جديدة.
+    """
+    df = df.copy(deep=False)
+    new_rows = new_rows.copy()
+    for col in df.columns:
+        if col not in new_rows.columns:
+            continue
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            values = _as_text(new_rows[col])
+            extra = pd.Index(values.dropna().unique()).difference(df[col].cat.categories)
+            if len(extra) > 0:
+                df[col] = df[col].cat.add_categories(extra)
+            new_rows[col] = pd.Categorical(values, dtype=df[col].dtype)
+        elif col in INT16_COLUMNS or col in DATE_COLUMNS:
+            new_rows[col] = new_rows[col].astype(df[col].dtype)
+    return df, new_rows
+
+def append_rows(df, new_rows, start=None):
+    """إلحاق صفوف جديدة بالجدول مع الحفاظ على أنواع الأعمدة
+    
+    تأخذ الصفوف الجديدة أرقاماً متتالية من start (افتراضياً بعد أكبر رقم
+    موجود)، فتبقى أرقام الصفوف الحالية ثابتة للفهارس المبنية عليها.
+    """
+    df, new_rows = conform_rows(df, new_rows)
+    if start is None:
+        start = next_label(df)
+    new_rows.index = pd.RangeIndex(start, start + len(new_rows))
+    return pd.concat([df, new_rows])
+
+def next_label(df):
+    """الرقم التالي لأكبر رقم صف في الجدول"""
+    return int(df.index.max()) + 1 if len(df) > 0 else 0
+
+# --- دوال مساعدة ---
+DEFAULT_INTERVAL_DAYS = 90  # افتراضي 3 شهور
+
+def prepare_data(df):
+    """تجهيز أعمدة بيانات الأجهزة بعد القراءة من أي مصدر"""
+    # استخراج كود المركز من Asset ID
+    df['Center_Code'] = df['Asset ID'].str.split('-').str[0:2].str.join('-')
+    df['Center_Name'] = df['Center_Code'].map(CENTERS_DICT)
+    
+    # تحويل التواريخ
+    if 'Installation Date' in df.columns:
+        df['Installation Date'] = pd.to_datetime(df['Installation Date'], errors='coerce')
+    
+    # إضافة أعمدة الصيانة إذا لم تكن موجودة
+    if 'Last_Maintenance' not in df.columns:
+        df['Last_Maintenance'] = pd.NaT
+    else:
+        df['Last_Maintenance'] = pd.to_datetime(df['Last_Maintenance'], errors='coerce')
+        
+    if 'Next_Maintenance' not in df.columns:
+        df['Next_Maintenance'] = pd.NaT
+    else:
+        df['Next_Maintenance'] = pd.to_datetime(df['Next_Maintenance'], errors='coerce')
+        
+    if 'Maintenance_Interval_Days' not in df.columns:
+        df['Maintenance_Interval_Days'] = DEFAULT_INTERVAL_DAYS
+    else:
+        df['Maintenance_Interval_Days'] = df['Maintenance_Interval_Days'].fillna(DEFAULT_INTERVAL_DAYS).astype(int)
+        
+    if 'Device_Status' not in df.columns:
+        df['Device_Status'] = 'عامل'  # عامل، معطل، تحت الصيانة
+    else:
+        df['Device_Status'] = df['Device_Status'].fillna('عامل')
+        
+    if 'Priority' not in df.columns:
+        df['Priority'] = 'متوسط'  # عالي، متوسط، منخفض
+    else:
+        df['Priority'] = df['Priority'].fillna('متوسط')
+        
+    if 'Notes' not in df.columns:
+        df['Notes'] = ''
+    else:
+        df['Notes'] = df['Notes'].fillna('')
+    
+    return apply_schema(df)
+
+def load_devices(file_path=DATA_FILE):
+    """قراءة بيانات الأجهزة من المخزن (SQLite أو Parquet أو Feather أو Excel)
+    
+    عند أول تشغيل يُستورد الملف الأصلي إلى قاعدة البيانات.
+    """
+    store = get_store(file_path)
+    sources = [path for path in IMPORT_SOURCES if os.path.exists(path)]
+    imported = not store.exists() and file_path == DATA_FILE and len(sources) > 0
+    if imported:
+        # أول تشغيل: استيراد الملف الأصلي إلى قاعدة البيانات
+        df = prepare_data(get_store(sources[0]).read())
+        store.write(df.drop(columns=DERIVED_COLUMNS))
+        return df
+    return prepare_data(store.read())
+
+# --- حالات الصيانة ---
+# الترتيب مهم: الحالة غير المحددة أولاً ثم الحالات حسب قرب الموعد
+MAINTENANCE_STATUSES = ["غير محدد", "متأخر", "عاجل", "قريب", "جيد"]
+MAINTENANCE_ICONS = ["⚪", "🔴", "🟠", "🟡", "🟢"]
+URGENT_DAYS = 7
+SOON_DAYS = 30
+
+def day_end(as_of=None):
+    """بداية اليوم التالي لـ as_of: المرجع الموحد لمقارنة المواعيد بدقة اليوم
+    
+    الموعد قبله متأخر (ومنه المستحق اليوم)، والأيام المتبقية تُعد منه، فتبقى
+    الحالة والفترات الزمنية ثابتة طوال اليوم ومتطابقة في كل مكان.
+    """
+    today = pd.Timestamp.now() if as_of is None else pd.Timestamp(as_of)
+    return today.normalize() + pd.Timedelta(days=1)
+
+def calculate_maintenance_status(row, as_of=None):
+    """حساب حالة الصيانة لجهاز واحد"""
+    if pd.isna(row['Next_Maintenance']):
+        return MAINTENANCE_STATUSES[0], MAINTENANCE_ICONS[0]
+    
+    days_until = (row['Next_Maintenance'] - day_end(as_of)).days
+    
+    if days_until < 0:
+        return MAINTENANCE_STATUSES[1], MAINTENANCE_ICONS[1]
+    elif days_until <= URGENT_DAYS:
+        return MAINTENANCE_STATUSES[2], MAINTENANCE_ICONS[2]
+    elif days_until <= SOON_DAYS:
+        return MAINTENANCE_STATUSES[3], MAINTENANCE_ICONS[3]
+    else:
+        return MAINTENANCE_STATUSES[4], MAINTENANCE_ICONS[4]
+
+def compute_maintenance_status(df, as_of=None):
+    """حساب حالة الصيانة لجميع الأجهزة دفعة واحدة
+    
+    يعيد DataFrame بعمودين تصنيفيين (Maintenance_Status و Status_Icon)
+    بنفس فهرس df، محسوبين مقابل تاريخ مرجعي واحد.
+    """
+    days_until = (df['Next_Maintenance'] - day_end(as_of)).dt.days
+    
+    codes = np.select(
+        [days_until.isna(), days_until < 0, days_until <= URGENT_DAYS, days_until <= SOON_DAYS],
+        [0, 1, 2, 3],
+        default=4
+    )
+    return pd.DataFrame({
+        'Maintenance_Status': pd.Categorical.from_codes(codes, MAINTENANCE_STATUSES),
+        'Status_Icon': pd.Categorical.from_codes(codes, MAINTENANCE_ICONS),
+    }, index=df.index)
+
+# --- المؤشرات المجمعة ---
+class FleetAggregates:
+    """عدادات الأجهزة المجمعة حسب (المركز، القسم، حالة الجهاز، حالة الصيانة)
+    
+    تُبنى مرة واحدة من البيانات ثم تُحدَّث بالفرق عند كل إضافة أو تعديل
+    أو حذف أو تسجيل صيانة، فتقرأ المؤشرات والرسوم عدد المجموعات فقط.
+    التحديث يُرجع نسخة جديدة (نسخ عند الكتابة) فلا تتغير نسخة تقرأ منها
+    جلسة أخرى، وversion رقم إصدار الجدول الذي تطابقه. حالات الصيانة محسوبة
+    مقابل تاريخ بنائها، لذلك يُعاد البناء عند تغير اليوم.
+    """
+    
+    KEYS = ['Center_Name', 'Scientific Department', 'Device_Status', 'Maintenance_Status']
+    
+    def __init__(self, df, as_of=None, version=None):
+        self.version = version
+        self.as_of = pd.Timestamp.now() if as_of is None else pd.Timestamp(as_of)
+        statuses = compute_maintenance_status(df, self.as_of)['Maintenance_Status'].astype(object)
+        grouped = df[self.KEYS[:3]].assign(
+            Maintenance_Status=statuses,
+            Interval=df['Maintenance_Interval_Days'].fillna(0)
+        ).groupby(self.KEYS, dropna=False, observed=True)['Interval'].agg(['size', 'sum'])
+        
+        self.groups = {}
+        for key, count, interval_sum in zip(grouped.index, grouped['size'], grouped['sum']):
+            self.groups[self._clean_key(key)] = [int(count), float(interval_sum)]
+    
+    @staticmethod
+    def _clean_key(values):
+        return tuple(None if pd.isna(v) else v for v in values)
+    
+    def is_stale(self):
+        return pd.Timestamp.now().normalize() != self.as_of.normalize()
+    
+    def _updated(self, changes):
+        """نسخة جديدة بعد تطبيق [(السجل، +1 أو -1)] (القوائم لا تُعدَّل في مكانها)"""
+        aggregates = object.__new__(FleetAggregates)
+        aggregates.version = None
+        aggregates.as_of = self.as_of
+        aggregates.groups = dict(self.groups)
+        for record, sign in changes:
+            record = dict(record)
+            record['Maintenance_Status'] = calculate_maintenance_status(record, self.as_of)[0]
+            key = self._clean_key(record.get(col) for col in self.KEYS)
+            interval = record.get('Maintenance_Interval_Days')
+            interval = float(interval) if pd.notna(interval) else 0.0
+            
+            count, interval_sum = aggregates.groups.get(key, (0, 0.0))
+            if count + sign <= 0:
+                aggregates.groups.pop(key, None)
+            else:
+                aggregates.groups[key] = [count + sign, interval_sum + sign * interval]
+        return aggregates
+    
+    def added(self, record):
+        return self._updated([(record, 1)])
+    
+    def removed(self, record):
+        return self._updated([(record, -1)])
+    
+    def replaced(self, old_record, new_record):
+        return self._updated([(old_record, -1), (new_record, 1)])
+    
+    def frame(self, centers=None, departments=None, statuses=None):
+        """جدول المجموعات بعد التصفية (عمود Count وعمود Interval_Sum)"""
+        df = pd.DataFrame(
+            [key + tuple(counts) for key, counts in self.groups.items()],
+            columns=self.KEYS + ['Count', 'Interval_Sum']
+        )
+        if centers:
+            df = df[df['Center_Name'].isin(centers)]
+        if departments:
+            df = df[df['Scientific Department'].isin(departments)]
+        if statuses:
+            df = df[df['Device_Status'].isin(statuses)]
+        return df
+
+def count_by(agg, column=None, value=None):
+    """عدد الأجهزة من جدول المجموعات، إجمالاً أو لقيمة واحدة من عمود"""
+    if column is None:
+        return int(agg['Count'].sum())
+    return int(agg.loc[agg[column] == value, 'Count'].sum())
+
+# --- فهرس البحث ---
+SEARCH_FIELDS = {
+    # الحقل: وزنه في ترتيب النتائج
+    'Asset ID': 5,
+    'Serial No': 4,
+    'Scientific Equipment Name': 3,
+    'Model': 2,
+    'Manufacturer': 1,
+}
+_DIACRITICS = re.compile('[\u0300-\u036f\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_ARABIC_VARIANTS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي', 'ؤ': 'و', 'ة': 'ه',
+})
+_TOKEN = re.compile(r'\w+')
+
+@functools.lru_cache(maxsize=100_000)
+def normalize_text(text):
+    """توحيد النص للبحث: حذف التشكيل والعلامات، توحيد الألف والياء والتاء المربوطة، وحالة الأحرف"""
+    text = unicodedata.normalize('NFKD', text).casefold()
+    return _DIACRITICS.sub('', text).translate(_ARABIC_VARIANTS)
+
+def tokenize(text):
+    return _TOKEN.findall(normalize_text(text))
+
+class SearchIndex:
+    """فهرس بحث نصي للأجهزة (فهرس مقلوب للكلمات + فهرس ثلاثيات للمفردات)
+    
+    كل كلمة تشير إلى الأجهزة التي تحتويها مع وزن أعلى حقل ظهرت فيه، وكل
+    ثلاثية أحرف تشير إلى الكلمات التي تحتويها، فيُبحث عن جزء من كلمة دون
+    مسح جميع الأجهزة. يُحدَّث جهازاً بجهاز عند الإضافة والتعديل والحذف.
+    """
+    
+    def __init__(self, df=None):
+        self.postings = {}      # كلمة -> {رقم الصف: الوزن}
+        self.grams = {}         # ثلاثية -> مجموعة الكلمات
+        self.doc_tokens = {}    # رقم الصف -> كلمات الجهاز
+        self._vocabulary = None
+        if df is not None:
+            columns = [col for col in SEARCH_FIELDS if col in df.columns]
+            for label, record in zip(df.index, df[columns].to_dict('records')):
+                self.add(label, record)
+    
+    @staticmethod
+    def _trigrams(token):
+        return {token[i:i + 3] for i in range(len(token) - 2)}
+    
+    def add(self, label, record):
+        weights = {}
+        for field, weight in SEARCH_FIELDS.items():
+            value = record.get(field)
+            if value is None or pd.isna(value):
+                continue
+            for token in tokenize(str(value)):
+                weights[token] = max(weights.get(token, 0), weight)
+        
+        for token, weight in weights.items():
+            if token not in self.postings:
+                self.postings[token] = {}
+                for gram in self._trigrams(token):
+                    self.grams.setdefault(gram, set()).add(token)
+                self._vocabulary = None
+            self.postings[token][label] = weight
+        self.doc_tokens[label] = list(weights)
+    
+    def remove(self, label):
+        for token in self.doc_tokens.pop(label, []):
+            docs = self.postings[token]
+            docs.pop(label, None)
+            if not docs:
+                del self.postings[token]
+                for gram in self._trigrams(token):
+                    self.grams[gram].discard(token)
+                self._vocabulary = None
+    
+    def _matching_tokens(self, term):
+        """الكلمات المطابقة لجزء البحث مع درجة المطابقة (3 تامة، 2 بداية، 1 جزء)"""
+        if len(term) >= 3:
+            candidates = sorted((self.grams.get(gram, set()) for gram in self._trigrams(term)), key=len)
+            tokens = set.intersection(*candidates) if candidates else set()
+            tokens = [token for token in tokens if term in token]
+        else:
+            # جزء قصير لا ثلاثيات له: مسح المفردات (أقل بكثير من الأجهزة) بحثاً عنه داخل الكلمات
+            if self._vocabulary is None:
+                self._vocabulary = list(self.postings)
+            tokens = [token for token in self._vocabulary if term in token]
+        return [(token, 3 if token == term else 2 if token.startswith(term) else 1) for token in tokens]
+    
+    def search(self, query):
+        """أرقام صفوف الأجهزة المطابقة لكل كلمات البحث مرتبة حسب الصلة"""
+        matches = [self._matching_tokens(term) for term in tokenize(query)]
+        # البدء بالجزء الأقل نتائج ثم فحص المرشحين فقط في بقية الأجزاء
+        matches.sort(key=lambda tokens: sum(len(self.postings[token]) for token, _ in tokens))
+        
+        scores = None
+        for tokens in matches:
+            term_scores = {}
+            for token, quality in tokens:
+                docs = self.postings[token]
+                if scores is not None and len(scores) < len(docs):
+                    docs = {label: docs[label] for label in scores if label in docs}
+                for label, weight in docs.items():
+                    score = quality * weight
+                    if score > term_scores.get(label, 0):
+                        term_scores[label] = score
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {label: scores[label] + score for label, score in term_scores.items() if label in scores}
+            if not scores:
+                return []
+        if scores is None:
+            return []
+        return sorted(scores, key=lambda label: (-scores[label], label))
+
+# --- فهارس bitmap لأعمدة التصفية ---
+BITMAP_COLUMNS = ['Center_Name', 'Scientific Department', 'Device_Status', 'Priority']
+
+class BitmapIndex:
+    """فهرس bitmap لأعمدة التصفية قليلة القيم
+    
+    لكل قيمة مصفوفة منطقية بطول الجدول (True في مواقع صفوفها)، فتصبح
+    التصفية بعدة أعمدة عمليات OR و AND على مصفوفات جاهزة بدل isin على كل
+    عمود. التعديلات تُرجع فهرساً جديداً يشارك المصفوفات غير المتغيرة، فلا
+    يتغير فهرس تقرأ منه جلسة أخرى. version رقم إصدار الجدول الذي يطابقه.
+    """
+    
+    def __init__(self, bitmaps, size, version=None):
+        self.bitmaps = bitmaps
+        self.size = size
+        self.version = version
+    
+    @classmethod
+    def build(cls, df, columns=BITMAP_COLUMNS, version=None):
+        bitmaps = {}
+        for column in columns:
+            codes, uniques = pd.factorize(df[column])
+            bitmaps[column] = {value: codes == code for code, value in enumerate(uniques)}
+        return cls(bitmaps, len(df), version)
+    
+    def mask(self, column, values):
+        """قناع الصفوف التي قيمة column فيها ضمن values"""
+        mask = np.zeros(self.size, dtype=bool)
+        for value in values:
+            bitmap = self.bitmaps[column].get(value)
+            if bitmap is not None:
+                mask |= bitmap
+        return mask
+    
+    def appended(self, record):
+        """الفهرس بعد إضافة صف في نهاية الجدول"""
+        bitmaps = {}
+        for column, values in self.bitmaps.items():
+            values = {value: np.append(bitmap, False) for value, bitmap in values.items()}
+            value = record.get(column)
+            if not pd.isna(value):
+                values.setdefault(value, np.zeros(self.size + 1, dtype=bool))[-1] = True
+            bitmaps[column] = values
+        return BitmapIndex(bitmaps, self.size + 1)
+    
+    def updated(self, position, changes):
+        """الفهرس بعد تعديل قيم الصف في الموقع position"""
+        bitmaps = dict(self.bitmaps)
+        for column, value in changes.items():
+            if column not in bitmaps:
+                continue
+            values = dict(bitmaps[column])
+            for old_value, bitmap in values.items():
+                if bitmap[position]:
+                    values[old_value] = bitmap.copy()
+                    values[old_value][position] = False
+                    break
+            if not pd.isna(value):
+                bitmap = values[value].copy() if value in values else np.zeros(self.size, dtype=bool)
+                bitmap[position] = True
+                values[value] = bitmap
+            bitmaps[column] = values
+        return BitmapIndex(bitmaps, self.size)
+    
+    def deleted(self, position):
+        """الفهرس بعد حذف الصف في الموقع position"""
+        bitmaps = {
+            column: {value: np.delete(bitmap, position) for value, bitmap in values.items()}
+            for column, values in self.bitmaps.items()
+        }
+        return BitmapIndex(bitmaps, self.size - 1)
+
+class DueIndex:
+    """فهرس مرتب لموعد الصيانة القادم (Next_Maintenance)
+    
+    dates مواعيد الصفوف مرتبة تصاعدياً وpositions مواقع صفوفها بنفس الترتيب،
+    فاستعلام "المستحق بين تاريخين" بحث ثنائي وشريحة (O(log n + k)) بدل
+    حساب الفرق على العمود كاملاً، والنتيجة مرتبة بالموعد دون ترتيب الجدول.
+    الصفوف بلا موعد لا تدخل الفهرس. التعديلات تُرجع فهرساً جديداً مثل
+    BitmapIndex، وversion رقم إصدار الجدول الذي يطابقه.
+    """
+    
+    def __init__(self, values, dates, positions, version=None):
+        self.values = values  # موعد كل صف بترتيب الجدول (NaT لمن لا موعد له)
+        self.dates = dates
+        self.positions = positions
+        self.version = version
+    
+    @property
+    def size(self):
+        return len(self.values)
+    
+    @classmethod
+    def build(cls, df, version=None):
+        values = df['Next_Maintenance'].to_numpy(dtype='datetime64[ns]')
+        positions = np.flatnonzero(~np.isnat(values))
+        positions = positions[np.argsort(values[positions], kind='stable')]
+        return cls(values, values[positions], positions, version)
+    
+    @staticmethod
+    def _date(value):
+        return pd.Timestamp(value).to_datetime64().astype('datetime64[ns]')
+    
+    def between(self, start=None, end=None, include_end=True):
+        """مواقع الصفوف التي موعدها من start إلى end، مرتبة بالموعد"""
+        low = 0 if start is None else self.dates.searchsorted(self._date(start), side='left')
+        if end is None:
+            high = len(self.dates)
+        else:
+            high = self.dates.searchsorted(self._date(end), side='right' if include_end else 'left')
+        return self.positions[low:max(low, high)]
+    
+    def time_range(self, time_range, as_of=None):
+        """مواقع صفوف فترة من TIME_RANGES بنفس معنى due_mask"""
+        start = day_end(as_of)
+        if time_range == 'متأخر':
+            return self.between(end=start, include_end=False)
+        if time_range in TIME_RANGE_DAYS:
+            end = start + pd.Timedelta(days=TIME_RANGE_DAYS[time_range] + 1)
+            return self.between(start, end, include_end=False)
+        return self.positions
+    
+    def mask(self, time_range, as_of=None):
+        """قناع منطقي بطول الجدول لفترة من TIME_RANGES"""
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.time_range(time_range, as_of)] = True
+        return mask
+    
+    def _without(self, position):
+        """(dates، positions) بعد إزالة مدخل الصف position"""
+        value = self.values[position]
+        if np.isnat(value):
+            return self.dates, self.positions
+        low = self.dates.searchsorted(value, side='left')
+        high = self.dates.searchsorted(value, side='right')
+        entry = low + np.flatnonzero(self.positions[low:high] == position)[0]
+        return np.delete(self.dates, entry), np.delete(self.positions, entry)
+    
+    @staticmethod
+    def _with(dates, positions, position, value):
+        if np.isnat(value):
+            return dates, positions
+        entry = dates.searchsorted(value, side='right')
+        return np.insert(dates, entry, value), np.insert(positions, entry, position)
+    
+    def appended(self, value):
+        """الفهرس بعد إضافة صف موعده value في نهاية الجدول"""
+        value = self._date(value)
+        dates, positions = self._with(self.dates, self.positions, self.size, value)
+        return DueIndex(np.append(self.values, value), dates, positions)
+    
+    def updated(self, position, value):
+        """الفهرس بعد تغيير موعد الصف في الموقع position إلى value"""
+        value = self._date(value)
+        dates, positions = self._with(*self._without(position), position, value)
+        values = self.values.copy()
+        values[position] = value
+        return DueIndex(values, dates, positions)
+    
+    def deleted(self, position):
+        """الفهرس بعد حذف الصف في الموقع position"""
+        dates, positions = self._without(position)
+        # مواقع الصفوف التالية تنزاح بواحد
+        positions = positions - (positions > position)
+        return DueIndex(np.delete(self.values, position), dates, positions)
+
+# --- البيانات المشتركة ---
+class FleetDataset:
+    """بيانات الأجهزة المشتركة بين جميع الجلسات
+    
+    نسخة واحدة في الذاكرة لكل العملية بدلاً من نسخة لكل جلسة. كل تعديل
+    يحفظ في المستودع ثم ينشر جدولاً جديداً (نسخ عند الكتابة) ويزيد رقم
+    الإصدار، فلا يتغير الجدول الذي تعرضه جلسة أخرى أثناء تشغيلها.
+    """
+    
+    def __init__(self, df, repository):
+        self.df = df
+        self.version = 0
+        self.repository = repository
+        # رقم صف الجهاز التالي: يزيد فقط، فلا يأخذ جهاز جديد رقم جهاز محذوف
+        self._next_label = next_label(df)
+        self._lock = threading.RLock()
+        self._aggregates = None
+        self._search_index = None
+        self._asset_index = None
+        self._bitmap_index = None
+        self._due_index = None
+    
+    @property
+    def aggregates(self):
+        """المؤشرات المجمعة (تُبنى عند الحاجة أو عند تغير اليوم)"""
+        with self._lock:
+            if self._aggregates is None or self._aggregates.is_stale():
+                self._aggregates = FleetAggregates(self.df, version=self.version)
+            return self._aggregates
+    
+    @property
+    def asset_index(self):
+        """فهرس Asset ID -> رقم الصف"""
+        with self._lock:
+            if self._asset_index is None:
+                self._asset_index = dict(zip(self.df['Asset ID'], self.df.index))
+            return self._asset_index
+    
+    def locate(self, asset_id):
+        """رقم صف الجهاز أو None"""
+        return self.asset_index.get(asset_id)
+    
+    @property
+    def search_index(self):
+        """فهرس البحث النصي (يُبنى عند أول بحث؛ يُقرأ عبر search)"""
+        with self._lock:
+            if self._search_index is None:
+                self._search_index = SearchIndex(self.df)
+            return self._search_index
+    
+    def search(self, query):
+        """بحث نصي في الفهرس (تحت القفل لأن الكتابات تعدّل الفهرس في مكانه)"""
+        with self._lock:
+            return self.search_index.search(query)
+    
+    @property
+    def bitmap_index(self):
+        """فهرس bitmap لأعمدة التصفية (version يحدد إصدار الجدول المطابق له)"""
+        with self._lock:
+            if self._bitmap_index is None:
+                self._bitmap_index = BitmapIndex.build(self.df, version=self.version)
+            return self._bitmap_index
+    
+    @property
+    def due_index(self):
+        """فهرس مواعيد الصيانة المرتب (version يحدد إصدار الجدول المطابق له)"""
+        with self._lock:
+            if self._due_index is None:
+                self._due_index = DueIndex.build(self.df, version=self.version)
+            return self._due_index
+    
+    def snapshot(self):
+        """الجدول ورقم إصداره معاً (لجلسة تقرأ نسخة ثابتة)"""
+        with self._lock:
+            return self.df, self.version
+    
+    def _publish(self, df):
+        self.df = df
+        self.version += 1
+        for index in (self._aggregates, self._bitmap_index, self._due_index):
+            if index is not None:
+                index.version = self.version
+    
+    def add(self, record):
+        with self._lock:
+            if record['Asset ID'] in self.asset_index:
+                raise ValueError(f"رقم Asset ID مستخدم مسبقاً: {record['Asset ID']}")
+            self.repository.add_device(record)
+            self._aggregates = self.aggregates.added(record)
+            df = append_rows(self.df, pd.DataFrame([record]), self._next_label)
+            self._next_label += 1
+            self.asset_index[record['Asset ID']] = df.index[-1]
+            if self._search_index is not None:
+                self._search_index.add(df.index[-1], record)
+            if self._bitmap_index is not None:
+                self._bitmap_index = self._bitmap_index.appended(record)
+            if self._due_index is not None:
+                self._due_index = self._due_index.appended(df['Next_Maintenance'].iat[-1])
+            self._publish(df)
+    
+    def _apply_changes(self, asset_id, changes):
+        df = self.df.copy(deep=False)
+        label = self.locate(asset_id)
+        if label is None:
+            raise KeyError(f"الجهاز غير موجود: {asset_id}")
+        idx = [label]
+        for old_record in df.loc[idx].to_dict('records'):
+            self._aggregates = self.aggregates.replaced(old_record, {**old_record, **changes})
+        for col, value in changes.items():
+            # عمود جديد بدلاً من التعديل في المكان حتى تبقى النسخة السابقة كما هي
+            df[col] = set_values(df[col], idx, value)
+        if self._search_index is not None and any(col in SEARCH_FIELDS for col in changes):
+            for label, record in zip(idx, df.loc[idx].to_dict('records')):
+                self._search_index.remove(label)
+                self._search_index.add(label, record)
+        position = df.index.get_loc(label)
+        if self._bitmap_index is not None:
+            self._bitmap_index = self._bitmap_index.updated(position, changes)
+        if self._due_index is not None and 'Next_Maintenance' in changes:
+            self._due_index = self._due_index.updated(position, df['Next_Maintenance'].iat[position])
+        self._publish(df)
+    
+    def update(self, asset_id, changes):
+        with self._lock:
+            self.repository.update_device(asset_id, changes)
+            self._apply_changes(asset_id, changes)
+    
+    def log_maintenance(self, asset_id, event, changes):
+        with self._lock:
+            self.repository.log_maintenance(asset_id, event, changes)
+            self._apply_changes(asset_id, changes)
+    
+    def delete(self, asset_id):
+        with self._lock:
+            label = self.locate(asset_id)
+            if label is None:
+                raise KeyError(f"الجهاز غير موجود: {asset_id}")
+            self.repository.delete_device(asset_id)
+            self._aggregates = self.aggregates.removed(self.df.loc[label].to_dict())
+            if self._search_index is not None:
+                self._search_index.remove(label)
+            position = self.df.index.get_loc(label)
+            if self._bitmap_index is not None:
+                self._bitmap_index = self._bitmap_index.deleted(position)
+            if self._due_index is not None:
+                self._due_index = self._due_index.deleted(position)
+            del self.asset_index[asset_id]
+            self._publish(self.df.drop(index=label))
+    
+    def save_rows(self, df_rows):
+        """حفظ صفوف معدلة حسب Asset ID (بكل الأعمدة أو بعضها)
+        
+        الصفوف تُطابق مع الجدول الحالي برقم Asset ID لا بفهرسها، فقد تكون من
+        نسخة أقدم، وتُهمل الأجهزة المحذوفة منذ ذلك. يُبنى الجدول الجديد أولاً
+        ثم يُحفظ في المستودع، فلا يُحفظ تعديل تعذر تطبيقه في الذاكرة.
+        """
+        with self._lock:
+            labels = [self.asset_index.get(asset_id) for asset_id in df_rows['Asset ID']]
+            found = [label is not None for label in labels]
+            df_rows = df_rows[found].set_axis([label for label in labels if label is not None])
+            if len(df_rows) == 0:
+                return
+            
+            df, df_rows = conform_rows(self.df, df_rows)
+            # نسخ الأعمدة المعدلة فقط حتى تبقى النسخة السابقة كما هي
+            changed = set(df_rows.columns) - {'Asset ID'}
+            for col in changed:
+                column = df[col].copy()
+                column.loc[df_rows.index] = df_rows[col]
+                df[col] = column
+            self.repository.save_rows(df_rows)
+            
+            # تعديل جماعي: إعادة بناء ما يعتمد على الأعمدة المعدلة عند القراءة التالية
+            if changed & set(FleetAggregates.KEYS + ['Next_Maintenance', 'Maintenance_Interval_Days']):
+                self._aggregates = None
+            if changed & set(SEARCH_FIELDS):
+                self._search_index = None
+            if changed & set(BITMAP_COLUMNS):
+                self._bitmap_index = None
+            if 'Next_Maintenance' in changed:
+                self._due_index = None
+            self._publish(df)
+    
+    def replace(self, df):
+        """استبدال جميع البيانات (استعادة نسخة احتياطية)"""
+        with self._lock:
+            # أعمدة الملف الزائدة (مثل Maintenance_Status في النسخ الاحتياطية) لا تُحفظ فلا تبقى في الذاكرة
+            df = df[[col for col in df.columns if col in DEVICE_COLUMNS or col in DERIVED_COLUMNS]]
+            self.repository.write(df.drop(columns=[col for col in DERIVED_COLUMNS if col in df.columns]))
+            self._aggregates = None
+            self._search_index = None
+            self._asset_index = None
+            self._bitmap_index = None
+            self._due_index = None
+            self._next_label = max(self._next_label, next_label(df))
+            self._publish(df)
+
+# --- تصدير التقارير ---
+REPORT_SHEET = 'تقرير الصيانة'
+EXPORT_CHUNK_ROWS = 5000
+STREAM_BLOCK_SIZE = 64 * 1024
+
+def iter_report_chunks(df, center=None, chunk_rows=EXPORT_CHUNK_ROWS, as_of=None):
+    """صفوف تقرير الصيانة على دفعات مع عمود حالة الصيانة
+    
+    لا يُنسخ الجدول كاملاً: كل دفعة تُقتطع وتُحسب حالتها ثم تُترك.
+    """
+    as_of = pd.Timestamp.now() if as_of is None else pd.Timestamp(as_of)
+    if center:
+        positions = np.flatnonzero((df['Center_Name'] == center).to_numpy())
+    else:
+        positions = np.arange(len(df))
+    
+    for start in range(0, len(positions), chunk_rows):
+        # عمود حالة قديم (من ملف مستورد) يُستبدل بعمود محسوب في آخر الجدول
+        chunk = df.iloc[positions[start:start + chunk_rows]].drop(columns='Maintenance_Status', errors='ignore')
+        yield chunk.assign(
+            Maintenance_Status=compute_maintenance_status(chunk, as_of)['Maintenance_Status']
+        )
+
+def write_maintenance_report(df, output, center=None):
+    """كتابة تقرير الصيانة إلى ملف أو كائن ملف بذاكرة ثابتة (constant_memory)"""
+    import xlsxwriter
+    
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss'
+    })
+    worksheet = workbook.add_worksheet(REPORT_SHEET)
+    
+    # تنسيق العناوين
+    header_format = workbook.add_format({
+        'bold': True,
+        'bg_color': '#4CAF50',
+        'font_color': 'white',
+        'align': 'center',
+        'border': 1
+    })
+    
+    columns = list(df.columns.drop('Maintenance_Status', errors='ignore')) + ['Maintenance_Status']
+    for col_num, value in enumerate(columns):
+        worksheet.write(0, col_num, value, header_format)
+        worksheet.set_column(col_num, col_num, 20)
+    
+    # الصفوف تُكتب بالترتيب وتُفرَّغ إلى القرص أولاً بأول
+    row_num = 1
+    for chunk in iter_report_chunks(df, center):
+        for values in chunk.itertuples(index=False, name=None):
+            worksheet.write_row(row_num, 0, [None if pd.isna(v) else v for v in values])
+            row_num += 1
+    
+    workbook.close()
+
+def stream_maintenance_report(df, center=None):
+    """تقرير الصيانة كأجزاء bytes متتالية للتنزيل المتدفق"""
+    with tempfile.TemporaryFile() as tmp:
+        write_maintenance_report(df, tmp, center)
+        tmp.seek(0)
+        while True:
+            block = tmp.read(STREAM_BLOCK_SIZE)
+            if not block:
+                break
+            yield block
+
+def export_maintenance_report(df, center=None):
+    """تصدير تقرير الصيانة"""
+    output = BytesIO()
+    for block in stream_maintenance_report(df, center):
+        output.write(block)
+    output.seek(0)
+    return output
+
+# --- ذاكرة التقارير المؤقتة ---
+REPORT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+class ReportCache:
+    """ذاكرة مؤقتة مشتركة لملفات التقارير المولدة (LRU محدودة بالحجم)
+    
+    المفتاح بصمة لنوع التقرير ومعايير التصفية وإصدار البيانات، فالتقرير
+    نفسه لا يُبنى مرتين ما دامت البيانات لم تتغير. عند تجاوز الحد يُحذف
+    الأقدم استخداماً أولاً.
+    """
+    
+    def __init__(self, max_bytes=REPORT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def fingerprint(*parts):
+        return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+    
+    def get(self, key):
+        """الملف المحفوظ (bytes) أو None"""
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+            return data
+    
+    def peek(self, key):
+        """مثل get لكن دون احتساب إصابة (لمعرفة وجود الملف قبل تقديمه)"""
+        with self._lock:
+            return self._items.get(key)
+    
+    def record_hit(self, key):
+        """احتساب إصابة لملف قُدِّم من الذاكرة بعد peek"""
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+    
+    @staticmethod
+    def sizeof(data):
+        return len(data)
+    
+    def put(self, key, data):
+        with self._lock:
+            if key in self._items:
+                self.size -= self.sizeof(self._items.pop(key))
+            if self.sizeof(data) > self.max_bytes:
+                return
+            self._items[key] = data
+            self.size += self.sizeof(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= self.sizeof(evicted)
+                self.evictions += 1
+    
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+    
+    def get_or_build(self, key, build):
+        data = self.get(key)
+        if data is None:
+            self.record_miss()
+            data = build()
+            if hasattr(data, 'getvalue'):
+                data = data.getvalue()
+            self.put(key, data)
+        return data
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._items),
+                'size': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+# --- فترات الصيانة ---
+def interval_updates(df, rules):
+    """صفوف تحديث فترات الصيانة حسب قواعد (اسم الجهاز -> الفترة بالأيام)
+    
+    rules قائمة أزواج أو dict، وتُطبَّق كلها بعملية واحدة على الجدول: تُضبط
+    Maintenance_Interval_Days ويُعاد حساب Next_Maintenance = Last_Maintenance
+    + الفترة للأجهزة التي لها صيانة سابقة. يُعيد الصفوف المطابقة فقط بفهرس df
+    (للحفظ عبر save_rows).
+    """
+    intervals = df['Scientific Equipment Name'].map(dict(rules))
+    return schedule_updates(df, intervals[intervals.notna()])
+
+def schedule_updates(df, intervals):
+    """صفوف تحديث الفترة والموعد القادم للأجهزة الموجودة في فهرس intervals"""
+    intervals = intervals.astype(int)
+    last_maintenance = df['Last_Maintenance'].loc[intervals.index]
+    next_maintenance = last_maintenance + pd.to_timedelta(intervals, unit='D')
+    return pd.DataFrame({
+        'Asset ID': df['Asset ID'].loc[intervals.index],
+        'Maintenance_Interval_Days': intervals,
+        'Next_Maintenance': next_maintenance.fillna(df['Next_Maintenance'].loc[intervals.index]),
+    })
+
+def current_intervals(df):
+    """فترة الصيانة الأكثر استخداماً لكل نوع جهاز"""
+    counts = df.groupby(['Scientific Equipment Name', 'Maintenance_Interval_Days'], observed=True) \
+        .size().reset_index(name='Count')
+    # عند التساوي تُختار الفترة الأقصر (مثل mode)
+    top = counts.sort_values(['Count', 'Maintenance_Interval_Days'], ascending=[False, True]) \
+        .drop_duplicates('Scientific Equipment Name')
+    return top.set_index('Scientific Equipment Name')['Maintenance_Interval_Days'].sort_index()
+
+# --- سياسة الصيانة ---
+POLICY_FIELDS = ['Name_Pattern', 'Department', 'Priority']
+
+def _code_mask(codes, uniques, value):
+    """قناع الصفوف التي قيمتها value من ناتج factorize"""
+    code = pd.Index(uniques).get_indexer([value])[0]
+    if code < 0:
+        return np.zeros(len(codes), dtype=bool)
+    return codes == code
+
+class MaintenancePolicy:
+    """قواعد فترات الصيانة: (نمط اسم الجهاز، القسم، الأولوية) -> الفترة بالأيام
+    
+    نمط الاسم بصيغة wildcard (مثل *X-Ray*) دون تمييز حالة الأحرف، والحقل
+    الفارغ يطابق أي قيمة. إذا طابقت الجهاز أكثر من قاعدة تُطبق الأكثر تحديداً
+    (عدد الحقول المحددة) ثم الأسبق في الجدول. التقييم على كل الأجهزة دفعة
+    واحدة: الأعمدة تُرمَّز مرة واحدة وكل قاعدة عمليات على مصفوفات الرموز.
+    """
+    
+    def __init__(self, rules):
+        rules = pd.DataFrame(rules, columns=list(POLICY_COLUMNS)).reset_index(drop=True)
+        for field in POLICY_FIELDS:
+            values = rules[field].astype(object).where(rules[field].notna(), '')
+            rules[field] = values.astype(str).str.strip().replace('', None)
+        rules = rules[pd.to_numeric(rules['Interval_Days'], errors='coerce') > 0].copy()
+        rules['Interval_Days'] = rules['Interval_Days'].astype(int)
+        # القواعد بترتيب إدخالها (للحفظ) وبترتيب التطبيق
+        self.table = rules.reset_index(drop=True)
+        specificity = self.table[POLICY_FIELDS].notna().sum(axis=1)
+        self._ordered = self.table.loc[specificity.sort_values(ascending=False, kind='stable').index]
+    
+    def intervals(self, df):
+        """فترة السياسة لكل جهاز (NaN للأجهزة التي لا تطابقها أي قاعدة)"""
+        name_codes, names = pd.factorize(df['Scientific Equipment Name'])
+        names = pd.Series(np.asarray(names, dtype=object)).astype(str).str.strip()
+        department_codes, departments = pd.factorize(df['Scientific Department'])
+        priority_codes, priorities = pd.factorize(df['Priority'])
+        
+        result = np.full(len(df), np.nan)
+        unassigned = np.ones(len(df), dtype=bool)
+        for rule in self._ordered.itertuples(index=False):
+            mask = unassigned.copy()
+            if rule.Name_Pattern is not None:
+                matched = names.str.match(fnmatch.translate(rule.Name_Pattern), case=False).to_numpy()
+                # الرمز -1 (اسم فارغ) يقع على العنصر الأخير False
+                mask &= np.append(matched, False)[name_codes]
+            if rule.Department is not None:
+                mask &= _code_mask(department_codes, departments, rule.Department)
+            if rule.Priority is not None:
+                mask &= _code_mask(priority_codes, priorities, rule.Priority)
+            result[mask] = rule.Interval_Days
+            unassigned &= ~mask
+        return pd.Series(result, index=df.index)
+    
+    def _deviating(self, df):
+        intervals = self.intervals(df)
+        return intervals[intervals.notna() & (intervals != df['Maintenance_Interval_Days'])]
+    
+    def deviations(self, df):
+        """الأجهزة التي تختلف فترتها عن فترة السياسة"""
+        intervals = self._deviating(df)
+        report = take_rows(df, df.index.get_indexer(intervals.index), [
+            'Asset ID', 'Scientific Equipment Name', 'Center_Name', 'Scientific Department',
+            'Priority', 'Maintenance_Interval_Days'
+        ])
+        report['Policy_Interval'] = intervals.astype(int)
+        return report
+    
+    def updates(self, df):
+        """صفوف تطبيق السياسة على الأجهزة المخالفة (للحفظ عبر save_rows)"""
+        return schedule_updates(df, self._deviating(df))
+
+# --- تصفية الأجهزة ---
+FILTER_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+TIME_RANGE_DAYS = {'خلال أسبوع': 7, 'خلال شهر': 30, 'خلال 3 شهور': 90}
+TIME_RANGES = ['متأخر', *TIME_RANGE_DAYS, 'الكل']
+
+def due_mask(next_maintenance, time_range, as_of=None):
+    """قناع الفترة الزمنية لموعد الصيانة القادم ('الكل' = أي موعد محدد)
+    
+    بدقة اليوم مثل compute_maintenance_status: 'متأخر' ما قبل day_end(as_of)
+    (ومنه المستحق اليوم)، و'خلال N' ما بقي له من 0 إلى N يوماً، فـ'خلال أسبوع'
+    يطابق حالة 'عاجل' و'خلال شهر' يطابق 'عاجل' و'قريب' معاً.
+    """
+    start = day_end(as_of)
+    mask = next_maintenance.notna()
+    if time_range == 'متأخر':
+        mask &= next_maintenance < start
+    elif time_range in TIME_RANGE_DAYS:
+        end = start + pd.Timedelta(days=TIME_RANGE_DAYS[time_range] + 1)
+        mask &= (next_maintenance >= start) & (next_maintenance < end)
+    return mask.to_numpy()
+
+def filter_rows(df, centers=(), departments=(), statuses=(), priorities=(), time_range=None,
+                as_of=None, bitmaps=None, due_index=None):
+    """مواقع صفوف الأجهزة المطابقة للفلاتر (للاستخدام مع df.iloc)
+    
+    القائمة الفارغة تعني عدم التقييد بالعمود، وtime_range=None تعني عدم
+    التقييد بموعد الصيانة. bitmaps فهرس BitmapIndex وdue_index فهرس DueIndex
+    مطابقان لـ df (اختياريان) يُستخدمان بدل isin وdue_mask.
+    """
+    selections = {
+        'Center_Name': centers,
+        'Scientific Department': departments,
+        'Device_Status': statuses,
+        'Priority': priorities,
+    }
+    mask = np.ones(len(df), dtype=bool)
+    for column, values in selections.items():
+        if len(values) == 0:
+            continue
+        if bitmaps is not None and column in bitmaps.bitmaps:
+            mask &= bitmaps.mask(column, values)
+        else:
+            mask &= df[column].isin(values).to_numpy()
+    if time_range is not None:
+        if due_index is not None:
+            mask &= due_index.mask(time_range, as_of)
+        else:
+            mask &= due_mask(df['Next_Maintenance'], time_range, as_of)
+    return np.flatnonzero(mask)
+
+def earliest_due(df, rows, before, limit, due_index=None):
+    """أقرب limit صفاً موعدها قبل before من بين المواقع rows، مرتبة بالموعد
+    
+    مع due_index تُقرأ المواعيد مرتبة من الفهرس فلا يُرتب إلا ما قبل before.
+    """
+    if due_index is not None:
+        selected = np.zeros(len(df), dtype=bool)
+        selected[rows] = True
+        candidates = due_index.between(end=before, include_end=False)
+        return candidates[selected[candidates]][:limit]
+    next_maintenance = df['Next_Maintenance'].take(rows)
+    rows = rows[(next_maintenance < before).to_numpy()]
+    return sort_rows(df, rows, ['Next_Maintenance'])[:limit]
+
+def take_rows(df, rows, columns):
+    """جدول بالصفوف المحددة (مواقع) والأعمدة المطلوبة فقط في نسخة واحدة
+    
+    كل عمود يُقتطع مباشرة من df، فلا يُنسخ الجدول كاملاً قبل اختيار الأعمدة.
+    """
+    return pd.DataFrame(
+        {column: df[column].array.take(rows) for column in columns},
+        index=df.index[rows],
+        copy=False
+    )
+
+def sort_rows(df, rows, by, ascending=True):
+    """ترتيب مواقع الصفوف حسب أعمدة by دون اقتطاع بقية الأعمدة"""
+    keys = pd.DataFrame({column: df[column].array.take(rows) for column in by}, copy=False)
+    return rows[keys.sort_values(by, ascending=ascending).index.to_numpy()]
+
+class FilterCache(ReportCache):
+    """ذاكرة مؤقتة لنتائج filter_rows (مصفوفات مواقع الصفوف) محدودة بالحجم"""
+    
+    def __init__(self, max_bytes=FILTER_CACHE_MAX_BYTES):
+        super().__init__(max_bytes)
+    
+    @staticmethod
+    def sizeof(data):
+        return data.nbytes
+
+# --- تخطيط الزيارات ---
+WEEKEND_DAYS = (4, 5)  # الجمعة والسبت
+PRIORITY_RANK = {'عالي': 0, 'متوسط': 1, 'منخفض': 2}
+# أقصى تأخير مسموح بعد موعد الصيانة (أيام) حسب الأولوية
+LATE_SLACK_DAYS = {'عالي': 0, 'متوسط': 3, 'منخفض': 7}
+PLAN_COLUMNS = [
+    'Planned_Date', 'Technician', 'Center_Name', 'Asset ID', 'Scientific Equipment Name',
+    'Priority', 'Next_Maintenance', 'Late'
+]
+
+def working_days(start, horizon_days, holidays=()):
+    """أيام العمل خلال horizon_days يوماً من start (بدون نهاية الأسبوع والإجازات)"""
+    days = pd.date_range(pd.Timestamp(start).normalize(), periods=horizon_days)
+    holidays = pd.DatetimeIndex(pd.to_datetime(list(holidays))).normalize()
+    return days[~days.weekday.isin(WEEKEND_DAYS) & ~days.isin(holidays)]
+
+class _VisitSchedule:
+    """رحلات الخطة: كل رحلة فني واحد يزور مركزاً واحداً في يوم واحد"""
+    
+    def __init__(self, n_days, technicians, capacity):
+        self.technicians = technicians
+        self.capacity = capacity
+        self.day_trips = [[] for _ in range(n_days)]
+        self.load = np.zeros(n_days, dtype=int)
+        self.trips = {}  # رقم الرحلة -> [اليوم، المركز، الأجهزة]
+        self._next_id = 0
+    
+    def open_trip(self, day, center):
+        trip = self._next_id
+        self._next_id += 1
+        self.trips[trip] = [day, center, []]
+        self.day_trips[day].append(trip)
+        return trip
+    
+    def close_trip(self, trip):
+        day, _, devices = self.trips.pop(trip)
+        self.day_trips[day].remove(trip)
+        self.load[day] -= len(devices)
+    
+    def add(self, trip, device):
+        self.trips[trip][2].append(device)
+        self.load[self.trips[trip][0]] += 1
+    
+    def find_trip(self, center, days, exclude=None):
+        """أول رحلة لنفس المركز فيها مكان ضمن الأيام days"""
+        for day in days:
+            for trip in self.day_trips[day]:
+                _, trip_center, devices = self.trips[trip]
+                if trip != exclude and trip_center == center and len(devices) < self.capacity:
+                    return trip
+        return None
+    
+    def free_days(self, days):
+        """الأيام التي فيها فني غير مشغول"""
+        return [day for day in days if len(self.day_trips[day]) < self.technicians]
+    
+    def move_trip(self, trip, day):
+        old_day, _, devices = self.trips[trip]
+        self.day_trips[old_day].remove(trip)
+        self.load[old_day] -= len(devices)
+        self.day_trips[day].append(trip)
+        self.load[day] += len(devices)
+        self.trips[trip][0] = day
+
+class VisitPlanner:
+    """خطة زيارات صيانة متوازنة لعبء الفنيين على أيام العمل
+    
+    كل فني يزور مركزاً واحداً في اليوم ويصين حتى devices_per_technician جهازاً.
+    لكل جهاز نافذة أيام مسموحة: من early_days قبل موعده إلى LATE_SLACK_DAYS
+    بعده حسب الأولوية (المتأخر من أول يوم عمل). التوزيع جشع بترتيب نهاية
+    النافذة ثم الأولوية، يفضّل رحلة قائمة لنفس المركز ثم أخف يوم؛ ثم بحث محلي
+    يدمج الرحلات القليلة في رحلات أخرى لنفس المركز وينقل رحلات من الأيام
+    المزدحمة إلى أيام أخف ضمن نوافذ أجهزتها.
+    """
+    
+    def __init__(self, technicians=4, devices_per_technician=8, early_days=7, late_days=None,
+                 holidays=(), max_rounds=20):
+        self.technicians = technicians
+        self.capacity = devices_per_technician
+        self.early_days = early_days
+        self.late_days = {**LATE_SLACK_DAYS, **(late_days or {})}
+        self.holidays = holidays
+        self.max_rounds = max_rounds
+    
+    def windows(self, devices, days):
+        """نافذة كل جهاز كمواقع في أيام العمل days: (أول يوم، آخر يوم)"""
+        due = devices['Next_Maintenance'].dt.normalize().to_numpy()
+        priority = devices['Priority'].astype(object)
+        late = priority.map(self.late_days).fillna(self.late_days['متوسط']).to_numpy()
+        anchor = np.maximum(due, days[0].to_datetime64())
+        first = days.searchsorted(due - np.timedelta64(self.early_days, 'D'))
+        last = days.searchsorted(anchor + late.astype('timedelta64[D]'), side='right') - 1
+        # النافذة التي تقع كلها في عطلة تمتد إلى أول يوم عمل بعدها
+        last = np.clip(np.maximum(last, first), 0, len(days) - 1)
+        return np.minimum(first, last), last
+    
+    def plan(self, df, start=None, horizon_days=30):
+        """خطة الزيارات للأجهزة المستحقة حتى آخر يوم عمل في الأفق (جدول PLAN_COLUMNS)
+        
+        الأجهزة التي لا يتسع لها الأفق تبقى بدون Planned_Date.
+        """
+        start = pd.Timestamp.now() if start is None else pd.Timestamp(start)
+        days = working_days(start, horizon_days, self.holidays)
+        if len(days) == 0:
+            return pd.DataFrame(columns=PLAN_COLUMNS)
+        rows = np.flatnonzero((df['Next_Maintenance'] < days[-1] + pd.Timedelta(days=1)).to_numpy())
+        devices = take_rows(df, rows, PLAN_COLUMNS[2:-1])
+        first, last = self.windows(devices, days)
+        centers = pd.factorize(devices['Center_Name'])[0]
+        rank = devices['Priority'].astype(object).map(PRIORITY_RANK).fillna(1).to_numpy()
+        
+        schedule = _VisitSchedule(len(days), self.technicians, self.capacity)
+        for device in np.lexsort((centers, first, rank, last)):
+            trip = self._place(schedule, centers[device], first[device], last[device])
+            if trip is not None:
+                schedule.add(trip, device)
+        
+        for _ in range(self.max_rounds):
+            if not (self._merge_trips(schedule, first, last)
+                    | self._balance_days(schedule, first, last)):
+                break
+        return self._to_frame(devices, schedule, days, last)
+    
+    def _place(self, schedule, center, first, last):
+        window = range(first, last + 1)
+        trip = schedule.find_trip(center, window)
+        if trip is not None:
+            return trip
+        free = schedule.free_days(window)
+        if free:
+            day = min(free, key=lambda day: (len(schedule.day_trips[day]), schedule.load[day], day))
+            return schedule.open_trip(day, center)
+        # لا مكان في النافذة: أقرب يوم بعدها (زيارة متأخرة)
+        after = range(last + 1, len(schedule.load))
+        trip = schedule.find_trip(center, after)
+        if trip is not None:
+            return trip
+        free = schedule.free_days(after)
+        return schedule.open_trip(free[0], center) if free else None
+    
+    def _allowed(self, schedule, device, trip, first, last):
+        """أيام يمكن نقل الجهاز إليها: نافذته، أو أي يوم أبكر إن كان متأخراً"""
+        return first[device], max(last[device], schedule.trips[trip][0])
+    
+    def _merge_trips(self, schedule, first, last):
+        """توزيع أجهزة الرحلات الصغيرة على رحلات أخرى لنفس المركز"""
+        changed = False
+        for trip in sorted(schedule.trips, key=lambda trip: len(schedule.trips[trip][2])):
+            if trip not in schedule.trips:
+                continue
+            day, center, devices = schedule.trips[trip]
+            targets = {}
+            spare = {}
+            for device in devices:
+                low, high = self._allowed(schedule, device, trip, first, last)
+                for other_day in range(low, high + 1):
+                    if other_day == day:
+                        continue
+                    target = next((
+                        other for other in schedule.day_trips[other_day]
+                        if other != trip and schedule.trips[other][1] == center
+                        and spare.setdefault(other, self.capacity - len(schedule.trips[other][2])) > 0
+                    ), None)
+                    if target is not None:
+                        spare[target] -= 1
+                        targets[device] = target
+                        break
+                else:
+                    break
+            if len(targets) < len(devices):
+                continue
+            schedule.close_trip(trip)
+            for device, target in targets.items():
+                schedule.add(target, device)
+            changed = True
+        return changed
+    
+    def _balance_days(self, schedule, first, last):
+        """نقل رحلات كاملة من الأيام الأكثر حملاً إلى أيام أخف ضمن نوافذ أجهزتها"""
+        changed = False
+        for day in np.argsort(-schedule.load, kind='stable'):
+            for trip in sorted(schedule.day_trips[day], key=lambda trip: len(schedule.trips[trip][2])):
+                devices = schedule.trips[trip][2]
+                low = max(first[device] for device in devices)
+                high = min(self._allowed(schedule, device, trip, first, last)[1] for device in devices)
+                free = [
+                    other for other in schedule.free_days(range(low, high + 1))
+                    if schedule.load[other] + len(devices) < schedule.load[day]
+                ]
+                if free:
+                    schedule.move_trip(trip, min(free, key=lambda other: (schedule.load[other], other)))
+                    changed = True
+        return changed
+    
+    def _to_frame(self, devices, schedule, days, last):
+        planned = pd.Series(pd.NaT, index=devices.index, dtype='datetime64[ns]')
+        technician = pd.Series(pd.NA, index=devices.index, dtype='Int16')
+        late = np.zeros(len(devices), dtype=bool)
+        for day, trips in enumerate(schedule.day_trips):
+            trips = sorted(trips, key=lambda trip: schedule.trips[trip][1])
+            for number, trip in enumerate(trips, start=1):
+                members = schedule.trips[trip][2]
+                planned.iloc[members] = days[day]
+                technician.iloc[members] = number
+                late[members] = day > last[members]
+        plan = devices.assign(Planned_Date=planned, Technician=technician, Late=late)[PLAN_COLUMNS]
+        return plan.sort_values(['Planned_Date', 'Technician', 'Next_Maintenance'], na_position='last')
+
+def daily_load(plan):
+    """ملخص الخطة لكل يوم: عدد الرحلات والأجهزة والمراكز"""
+    scheduled = plan.dropna(subset=['Planned_Date'])
+    return scheduled.groupby('Planned_Date').agg(
+        Trips=('Technician', 'nunique'),
+        Devices=('Asset ID', 'size'),
+        Centers=('Center_Name', 'nunique'),
+        Late=('Late', 'sum'),
+    )
+
+# --- مسارات الفنيين ---
+DEPOT_CODE = 'DEPOT'  # مقر انطلاق الفنيين في مصفوفة المسافات
+DISTANCES_FILE = os.path.join(DATA_DIR, 'center_distances.csv')
+ROUTE_COLUMNS = PLAN_COLUMNS[:2] + ['Stop'] + PLAN_COLUMNS[2:]
+
+def load_distances(source=DISTANCES_FILE, depot=DEPOT_CODE):
+    """مصفوفة المسافات (كم) بين رموز المراكز والمقر من ملف CSV مربع"""
+    matrix = pd.read_csv(source, index_col=0)
+    matrix.index = matrix.index.astype(str).str.strip()
+    matrix.columns = matrix.columns.astype(str).str.strip()
+    if matrix.index.has_duplicates or set(matrix.index) != set(matrix.columns):
+        raise ValueError("مصفوفة المسافات يجب أن تكون مربعة بنفس الرموز في الصفوف والأعمدة")
+    if depot not in matrix.index:
+        raise ValueError(f"مصفوفة المسافات لا تحتوي المقر {depot}")
+    matrix = matrix[list(matrix.index)].apply(pd.to_numeric, errors='coerce')
+    if matrix.isna().any().any() or (matrix < 0).any().any():
+        raise ValueError("مصفوفة المسافات تحتوي قيماً مفقودة أو سالبة")
+    return matrix.astype(float)
+
+def synthetic_distances(codes=None, depot=DEPOT_CODE, radius_km=80, seed=0):
+    """مصفوفة مسافات تجريبية: مواقع عشوائية حول المقر ومسافة الطريق ≈ 1.3 × الخط المستقيم"""
+    codes = [code for _, code in CENTERS] if codes is None else list(codes)
+    rng = np.random.default_rng(seed)
+    points = np.vstack([[0, 0], rng.uniform(-radius_km, radius_km, (len(codes), 2))])
+    distances = np.hypot(*(points[:, None, :] - points[None, :, :]).transpose(2, 0, 1)) * 1.3
+    labels = [depot, *codes]
+    return pd.DataFrame(distances.round(1), index=labels, columns=labels)
+
+def synthetic_fleet(size, start=None, seed=0):
+    """أسطول تجريبي بأعمدة التخطيط لقياس أداء المخططات"""
+    start = pd.Timestamp.now().normalize() if start is None else pd.Timestamp(start).normalize()
+    rng = np.random.default_rng(seed)
+    centers = rng.choice([name for name, _ in CENTERS], size)
+    return pd.DataFrame({
+        'Asset ID': [f"SYN-{i:06d}" for i in range(size)],
+        'Scientific Equipment Name': rng.choice(['Ultrasound', 'X-Ray', 'ECG', 'Centrifuge'], size),
+        'Center_Name': pd.Categorical(centers),
+        'Priority': pd.Categorical(rng.choice(['عالي', 'متوسط', 'منخفض'], size, p=[0.2, 0.5, 0.3])),
+        'Next_Maintenance': start + pd.to_timedelta(rng.integers(-10, 90, size), unit='D'),
+    })
+
+class RoutePlanner(VisitPlanner):
+    """مسارات يومية للفنيين بين المراكز تقلل المسافة مع الالتزام بالمواعيد
+    
+    أيام الزيارة من VisitPlanner (نوافذ المواعيد والأولوية وسعة الفنيين)، ثم
+    تُجمع زيارات كل يوم في مسارات تبدأ وتنتهي في المقر: الزيارات غير الممتلئة
+    تُدمج بخوارزمية التوفير (Clarke-Wright) ضمن سعة الفني وأقصى مسافة للمسار،
+    ثم يُحسَّن ترتيب محطات كل مسار بـ 2-opt. الدمج لا يغير يوم أي جهاز، فلا
+    تتأثر المواعيد ويقل عدد الفنيين اللازمين والمسافة.
+    """
+    
+    def __init__(self, distances, technicians=4, devices_per_technician=8, early_days=7,
+                 late_days=None, holidays=(), max_route_km=None, depot=DEPOT_CODE):
+        super().__init__(technicians, devices_per_technician, early_days, late_days, holidays)
+        self.codes = distances.index
+        self.matrix = distances.to_numpy(dtype=float)
+        self.depot = self.codes.get_loc(depot)
+        self.max_route_km = max_route_km
+    
+    def nodes(self, centers):
+        """موقع كل مركز في مصفوفة المسافات (خطأ للمراكز غير الموجودة فيها)"""
+        codes = centers.astype(object).map(CENTERS_DICT_REV)
+        nodes = self.codes.get_indexer(codes)
+        missing = sorted(set(centers[nodes < 0].astype(str)))
+        if missing:
+            raise ValueError(f"مراكز غير موجودة في مصفوفة المسافات: {', '.join(missing)}")
+        return nodes
+    
+    def route_km(self, stops):
+        path = [self.depot, *stops, self.depot]
+        return float(self.matrix[path[:-1], path[1:]].sum())
+    
+    def plan(self, df, start=None, horizon_days=30):
+        """مسارات الأجهزة المستحقة حتى آخر يوم عمل في الأفق (جدول ROUTE_COLUMNS)"""
+        visits = super().plan(df, start, horizon_days)
+        index = visits.index
+        visits = visits.reset_index(drop=True)
+        scheduled = visits['Planned_Date'].notna().to_numpy()
+        nodes = np.full(len(visits), -1)
+        nodes[scheduled] = self.nodes(visits.loc[scheduled, 'Center_Name'])
+        
+        technician = np.zeros(len(visits), dtype=int)
+        stop = np.zeros(len(visits), dtype=int)
+        for _, day_visits in visits[scheduled].groupby('Planned_Date'):
+            # كل زيارة من VisitPlanner محطة واحدة: مواقع أجهزتها في visits
+            members = [
+                day_visits.index[rows].to_numpy()
+                for rows in day_visits.groupby('Technician').indices.values()
+            ]
+            stop_nodes = np.array([nodes[rows[0]] for rows in members])
+            routes = self._merge_routes(stop_nodes, [len(rows) for rows in members])
+            routes.sort(key=lambda route: -sum(len(members[key]) for key in route))
+            for number, route in enumerate(routes, start=1):
+                for position, key in enumerate(self._two_opt(route, stop_nodes), start=1):
+                    technician[members[key]] = number
+                    stop[members[key]] = position
+        
+        plan = visits.assign(
+            Technician=pd.Series(technician, dtype='Int16').where(scheduled),
+            Stop=pd.Series(stop, dtype='Int16').where(scheduled),
+        ).set_axis(index)
+        return plan[ROUTE_COLUMNS].sort_values(
+            ['Planned_Date', 'Technician', 'Stop', 'Next_Maintenance'], na_position='last'
+        )
+    
+    def _merge_routes(self, stop_nodes, sizes):
+        """دمج الزيارات غير الممتلئة بترتيب التوفير d(i،مقر) + d(مقر،j) - d(i،j)"""
+        routes = {key: [key] for key in range(len(sizes))}
+        load = dict(enumerate(sizes))
+        owner = list(range(len(sizes)))  # الزيارة -> مفتاح مسارها
+        
+        matrix, depot = self.matrix, self.depot
+        partial = [key for key in routes if sizes[key] < self.capacity]
+        savings = sorted((
+            (matrix[stop_nodes[i], depot] + matrix[depot, stop_nodes[j]] - matrix[stop_nodes[i], stop_nodes[j]], i, j)
+            for i in partial for j in partial if i != j
+        ), reverse=True)
+        for saving, i, j in savings:
+            if saving <= 0:
+                break
+            a, b = owner[i], owner[j]
+            # i آخر محطة في مساره وj أول محطة في الآخر
+            if a == b or routes[a][-1] != i or routes[b][0] != j:
+                continue
+            if load[a] + load[b] > self.capacity:
+                continue
+            merged = routes[a] + routes[b]
+            if self.max_route_km is not None and self.route_km(stop_nodes[merged]) > self.max_route_km:
+                continue
+            routes[a] = merged
+            load[a] += load.pop(b)
+            for key in routes.pop(b):
+                owner[key] = a
+        return list(routes.values())
+    
+    def _two_opt(self, route, stop_nodes):
+        """تحسين ترتيب محطات المسار بعكس المقاطع ما دامت المسافة تقل"""
+        best, best_km = route, self.route_km(stop_nodes[route])
+        improved = True
+        while improved:
+            improved = False
+            for i in range(len(best) - 1):
+                for j in range(i + 2, len(best) + 1):
+                    candidate = best[:i] + best[i:j][::-1] + best[j:]
+                    km = self.route_km(stop_nodes[candidate])
+                    if km < best_km - 1e-9:
+                        best, best_km, improved = candidate, km, True
+        return best
+    
+    def summary(self, plan):
+        """ملخص المسارات: (اليوم، الفني) -> المحطات والأجهزة والمسافة
+        
+        يقبل أيضاً خطة VisitPlanner (زيارة مركز واحد لكل فني).
+        """
+        scheduled = plan.dropna(subset=['Planned_Date'])
+        if 'Stop' not in scheduled.columns:
+            scheduled = scheduled.assign(Stop=1)
+        scheduled = scheduled.assign(Node=self.nodes(scheduled['Center_Name']))
+        result = []
+        for (day, number), route in scheduled.groupby(['Planned_Date', 'Technician'], sort=True):
+            stops = route.sort_values('Stop').drop_duplicates('Stop')
+            result.append({
+                'Planned_Date': day,
+                'Technician': number,
+                'Route': ' ← '.join(stops['Center_Name'].astype(str)),
+                'Stops': len(stops),
+                'Devices': len(route),
+                'Distance_km': round(self.route_km(list(stops['Node'])), 1),
+            })
+        return pd.DataFrame(result, columns=[
+            'Planned_Date', 'Technician', 'Route', 'Stops', 'Devices', 'Distance_km'
+        ])
+
+# --- مهام التقارير في الخلفية ---
+REPORT_WORKERS = min(4, os.cpu_count() or 1)
+MAX_FINISHED_JOBS = 50
+
+def build_report_file(df, center=None):
+    """ملف تقرير الصيانة كـ bytes (يُنفّذ داخل عملية عاملة)"""
+    return export_maintenance_report(df, center).getvalue()
+
+def zip_reports(names, files):
+    """ضم ملفات التقارير في أرشيف ZIP واحد"""
+    output = BytesIO()
+    # ملفات xlsx مضغوطة أصلاً فتُخزّن كما هي
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED) as archive:
+        for name, data in zip(names, files):
+            archive.writestr(f"report_{name}.xlsx", data)
+    return output.getvalue()
+
+def report_job(df, center=None):
+    """مهمة تقرير واحد: (قائمة المهام الجزئية، دالة ضم النتائج)"""
+    return [(build_report_file, (df, center))], operator.itemgetter(0)
+
+def center_reports_job(df):
+    """مهمة تقارير كل المراكز في ZIP واحد
+    
+    الجدول يُقسّم بتمرير groupby واحد، وتقرير كل مركز مهمة جزئية مستقلة
+    تُبنى بالتوازي.
+    """
+    names, tasks = [], []
+    for center, group in df.groupby('Center_Name', observed=True, sort=True):
+        names.append(center)
+        tasks.append((build_report_file, (group,)))
+    return tasks, functools.partial(zip_reports, names)
+
+class ReportJobQueue:
+    """طابور مهام التقارير الكبيرة على مجمع عمليات
+    
+    تُرسل المهمة إلى ProcessPoolExecutor ويُعاد رقمها، فتستعلم الجلسة عن
+    حالتها ثم تجلب الملف عند اكتماله بدل انتظار البناء. المجمع يُنشأ عند
+    أول مهمة بطريقة spawn لأن خادم الواجهة متعدد الخيوط، ويُستبدل بمجمع
+    جديد إذا تعطل بموت إحدى عملياته (مثل نفاد الذاكرة).
+    """
+    
+    def __init__(self, max_workers=REPORT_WORKERS):
+        self.max_workers = max_workers
+        self._executor = None
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+    
+    def _submit_parts(self, tasks):
+        try:
+            return [self._pool().submit(fn, *args) for fn, args in tasks]
+        except BrokenProcessPool:
+            # المهام الجارية على المجمع المعطل تفشل وحدها؛ الجديدة تذهب لمجمع جديد
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            return [self._pool().submit(fn, *args) for fn, args in tasks]
+    
+    def submit(self, label, tasks, combine=list):
+        """إرسال مهمة وإرجاع رقمها
+        
+        tasks قائمة (دالة، معاملات) تُنفّذ بالتوازي، وcombine تضم نتائجها
+        بالترتيب عند الجلب.
+        """
+        with self._lock:
+            job_id = uuid.uuid4().hex[:12]
+            self._jobs[job_id] = {
+                'label': label,
+                'parts': self._submit_parts(tasks),
+                'combine': combine,
+                'submitted': datetime.now(),
+            }
+            self._prune()
+        return job_id
+    
+    def _prune(self):
+        # المهام المنتهية التي لم تُجلب نتيجتها تُحذف الأقدم فالأقدم
+        finished = [job_id for job_id, job in self._jobs.items()
+                    if all(part.done() for part in job['parts'])]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+    
+    def status(self, job_id):
+        """حالة المهمة (queued / running / done / failed / unknown) ونسبة إنجازها"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return {'state': 'unknown', 'progress': 0.0}
+        
+        parts = job['parts']
+        done = [part for part in parts if part.done()]
+        errors = [part.exception() for part in done if part.exception() is not None]
+        if errors:
+            state = 'failed'
+        elif len(done) == len(parts):
+            state = 'done'
+        elif done or any(part.running() for part in parts):
+            state = 'running'
+        else:
+            state = 'queued'
+        
+        return {
+            'state': state,
+            'progress': len(done) / len(parts),
+            'label': job['label'],
+            'elapsed': (datetime.now() - job['submitted']).total_seconds(),
+            'error': str(errors[0]) if errors else None,
+        }
+    
+    def result(self, job_id):
+        """ناتج المهمة المكتملة، وتُحذف من الطابور بعد جلبه"""
+        with self._lock:
+            job = self._jobs.pop(job_id)
+        return job['combine']([part.result() for part in job['parts']])
+    
+    def jobs(self):
+        """المهام الحالية (رقم المهمة -> الحالة)"""
+        with self._lock:
+            job_ids = list(self._jobs)
+        return {job_id: self.status(job_id) for job_id in job_ids}
+
+# --- تشخيص زمن الاستيراد ---
+_IMPORT_TIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+def import_profile(modules, top=20):
+    """زمن استيراد الوحدات (مثل python -X importtime) مرتباً حسب الزمن التراكمي
+    
+    الاستيراد يتم في عملية Python جديدة، فلا تؤثر الوحدات المحملة مسبقاً.
+    Depth هو عمق الوحدة في شجرة الاستيراد (0 للوحدات المطلوبة مباشرة).
+    """
+    code = '; '.join(f'import {module}' for module in modules)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(cumulative_us) / 1000, int(self_us) / 1000, len(indent) // 2))
+    
+    profile = pd.DataFrame(rows, columns=['Module', 'Cumulative_ms', 'Self_ms', 'Depth'])
+    return profile.sort_values('Cumulative_ms', ascending=False).head(top).reset_index(drop=True)
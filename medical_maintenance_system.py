@@ -5,14 +5,22 @@
 Medical Equipment Maintenance Management System
 """
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 from datetime import datetime, timedelta
-import plotly.express as px
-import plotly.graph_objects as go
-from io import BytesIO
 import json
 
+from maintenance_core import (
+    CENTERS_DICT_REV, DATA_FILE, DeviceRepository,
+    memory_report, prepare_data, load_devices, compute_maintenance_status,
+    count_by, FleetAggregates, FleetDataset, export_maintenance_report, ReportCache,
+    ReportJobQueue, report_job, center_reports_job, import_profile,
+    FilterCache, filter_rows, take_rows, sort_rows, earliest_due, TIME_RANGES,
+    day_end, URGENT_DAYS, interval_updates, current_intervals, MaintenancePolicy, VisitPlanner, daily_load,
+    RoutePlanner, load_distances, DISTANCES_FILE, DEPOT_CODE
+)
+
 # --- إعدادات الصفحة ---
 st.set_page_config(
     page_title="نظام إدارة الصيانة الطبية",
@@ -68,129 +76,223 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# --- قائمة المراكز الصحية ---
-CENTERS = [
-    ("الخلاوية", "KHL-PHC"), ("جبل القهر", "GQH-PHC"), ("مقزع", "MQZ-PHC"),
-    ("القوام", "QWM-PHC"), ("الجبل الأسود", "BLM-PHC"), ("السادة", "SAD-PHC"),
-    ("بيش الشمالي", "NBS-PHC"), ("قرية بيش", "VBS-PHC"), ("المحلة", "MHL-PHC"),
-    ("العشة", "ASH-PHC"), ("أبو السداد", "ASD-PHC"), ("العالية", "ALA-PHC"),
-    ("السلامة", "SAL-PHC"), ("مسلية", "MSL-PHC"), ("عتود", "ATD-PHC"),
-    ("الفطيحة", "FTH-PHC"), ("منشبة", "MNS-PHC"), ("قايم الدش", "QDS-PHC"),
-    ("المطعن", "MTN-PHC"), ("الحقو", "HAQ-PHC"), ("الريث", "RYT-PHC"),
-    ("الشقيق", "SHQ-PHC"), ("الدرب", "DRB-PHC"), ("بيش الجنوبي", "SBS-PHC"),
-    ("عمود", "AMD-PHC")
-]
-
-CENTERS_DICT = {code: name for name, code in CENTERS}
-CENTERS_DICT_REV = {name: code for name, code in CENTERS}
-
-# --- دوال مساعدة ---
-@st.cache_data
-def load_data(file_path):
-    """تحميل بيانات الأجهزة من ملف Excel"""
+def load_data(file_path=DATA_FILE):
+    """تحميل بيانات الأجهزة من المخزن (SQLite أو Parquet أو Feather أو Excel)"""
     try:
-        df = pd.read_excel(file_path)
-        
-        # استخراج كود المركز من Asset ID
-        df['Center_Code'] = df['Asset ID'].str.split('-').str[0:2].str.join('-')
-        df['Center_Name'] = df['Center_Code'].map(CENTERS_DICT)
-        
-        # تحويل التواريخ
-        if 'Installation Date' in df.columns:
-            df['Installation Date'] = pd.to_datetime(df['Installation Date'], errors='coerce')
-        
-        # إضافة أعمدة الصيانة إذا لم تكن موجودة
-        if 'Last_Maintenance' not in df.columns:
-            df['Last_Maintenance'] = pd.NaT
-        else:
-            df['Last_Maintenance'] = pd.to_datetime(df['Last_Maintenance'], errors='coerce')
-            
-        if 'Next_Maintenance' not in df.columns:
-            df['Next_Maintenance'] = pd.NaT
-        else:
-            df['Next_Maintenance'] = pd.to_datetime(df['Next_Maintenance'], errors='coerce')
-            
-        if 'Maintenance_Interval_Days' not in df.columns:
-            df['Maintenance_Interval_Days'] = 90  # افتراضي 3 شهور
-            
-        if 'Device_Status' not in df.columns:
-            df['Device_Status'] = 'عامل'  # عامل، معطل، تحت الصيانة
-            
-        if 'Priority' not in df.columns:
-            df['Priority'] = 'متوسط'  # عالي، متوسط، منخفض
-            
-        if 'Notes' not in df.columns:
-            df['Notes'] = ''
-            
-        return df
+        return load_devices(file_path)
     except Exception as e:
         st.error(f"خطأ في تحميل البيانات: {e}")
         return None
 
-def calculate_maintenance_status(row):
-    """حساب حالة الصيانة للجهاز"""
-    today = pd.Timestamp.now()
-    
-    if pd.isna(row['Next_Maintenance']):
-        return "غير محدد", "⚪"
-    
-    days_until = (row['Next_Maintenance'] - today).days
-    
-    if days_until < 0:
-        return "متأخر", "🔴"
-    elif days_until <= 7:
-        return "عاجل", "🟠"
-    elif days_until <= 30:
-        return "قريب", "🟡"
-    else:
-        return "جيد", "🟢"
+@st.cache_resource
+def get_repository():
+    """مستودع الأجهزة المشترك بين الجلسات"""
+    return DeviceRepository(DATA_FILE)
 
-def save_data(df, file_path):
-    """حفظ البيانات المحدثة"""
+@st.cache_resource
+def get_dataset():
+    """بيانات الأجهزة المشتركة (تُحمّل مرة واحدة لكل العملية)"""
+    df = load_data(DATA_FILE)
+    if df is None:
+        raise RuntimeError("فشل تحميل البيانات")
+    return FleetDataset(df, get_repository())
+
+def find_device(df, asset_id):
+    """سجل الجهاز من جدول الجلسة عبر فهرس Asset ID (أو None إن لم يوجد)"""
+    label = get_dataset().locate(asset_id)
+    if label is None or label not in df.index or df.at[label, 'Asset ID'] != asset_id:
+        return None
+    return df.loc[label]
+
+def add_device(record):
+    """إضافة جهاز جديد إلى المستودع وإلى البيانات المشتركة"""
     try:
-        # حذف الأعمدة المؤقتة قبل الحفظ
-        cols_to_drop = ['Center_Code', 'Center_Name']
-        df_to_save = df.drop(columns=[col for col in cols_to_drop if col in df.columns])
-        df_to_save.to_excel(file_path, index=False)
-        return True
+        get_dataset().add(record)
     except Exception as e:
         st.error(f"خطأ في حفظ البيانات: {e}")
         return False
+    return True
 
-def export_maintenance_report(df, center=None):
-    """تصدير تقرير الصيانة"""
-    if center:
-        df_export = df[df['Center_Name'] == center].copy()
-    else:
-        df_export = df.copy()
+def update_device(asset_id, changes):
+    """تعديل جهاز واحد في المستودع وفي البيانات المشتركة"""
+    try:
+        get_dataset().update(asset_id, changes)
+    except Exception as e:
+        st.error(f"خطأ في حفظ البيانات: {e}")
+        return False
+    return True
+
+def log_maintenance(asset_id, event, changes):
+    """تسجيل صيانة منجزة في سجل الصيانة وتحديث موعد الجهاز"""
+    try:
+        get_dataset().log_maintenance(asset_id, event, changes)
+    except Exception as e:
+        st.error(f"خطأ في حفظ سجل الصيانة: {e}")
+        return False
+    return True
+
+def delete_device(asset_id):
+    """حذف جهاز من المستودع ومن البيانات المشتركة"""
+    try:
+        get_dataset().delete(asset_id)
+    except Exception as e:
+        st.error(f"خطأ في حذف البيانات: {e}")
+        return False
+    return True
+
+def save_rows(df_rows):
+    """حفظ صفوف معدلة إلى المستودع وإلى البيانات المشتركة"""
+    try:
+        get_dataset().save_rows(df_rows)
+    except Exception as e:
+        st.error(f"خطأ في حفظ البيانات: {e}")
+        return False
+    return True
+
+@st.cache_resource
+def get_report_cache():
+    """ذاكرة التقارير المشتركة بين الجلسات"""
+    return ReportCache()
+
+@st.cache_resource
+def get_job_queue():
+    """طابور مهام التقارير المشترك بين الجلسات"""
+    return ReportJobQueue()
+
+@st.cache_resource
+def get_filter_cache():
+    """ذاكرة نتائج التصفية المشتركة بين الجلسات"""
+    return FilterCache()
+
+def filtered_rows(df, centers=(), departments=(), statuses=(), priorities=(), time_range=None):
+    """مواقع صفوف جدول الجلسة المطابقة للفلاتر، من الذاكرة المؤقتة إن وُجدت
     
-    # إضافة حالة الصيانة
-    df_export['Maintenance_Status'] = df_export.apply(
-        lambda row: calculate_maintenance_status(row)[0], axis=1
+    المفتاح (إصدار البيانات، الفلاتر، اليوم)، فالتنقل بين التركيبات
+    المستخدمة مؤخراً لا يعيد مسح الجدول.
+    """
+    version = st.session_state.get('data_version')
+    # الفترات الزمنية بدقة اليوم (day_end)، فالنتيجة ثابتة خلال اليوم ومطابقة لمفتاحها
+    today = pd.Timestamp.now().normalize()
+    key = FilterCache.fingerprint(
+        version, tuple(sorted(centers)), tuple(sorted(departments)),
+        tuple(sorted(statuses)), tuple(sorted(priorities)), time_range, today
     )
     
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df_export.to_excel(writer, sheet_name='تقرير الصيانة', index=False)
-        
-        workbook = writer.book
-        worksheet = writer.sheets['تقرير الصيانة']
-        
-        # تنسيق العناوين
-        header_format = workbook.add_format({
-            'bold': True,
-            'bg_color': '#4CAF50',
-            'font_color': 'white',
-            'align': 'center',
-            'border': 1
-        })
-        
-        for col_num, value in enumerate(df_export.columns.values):
-            worksheet.write(0, col_num, value, header_format)
-            worksheet.set_column(col_num, col_num, 20)
+    def build():
+        dataset = get_dataset()
+        return filter_rows(
+            df, centers, departments, statuses, priorities, time_range, as_of=today,
+            bitmaps=session_index(dataset.bitmap_index),
+            due_index=session_index(dataset.due_index) if time_range is not None else None
+        )
+    
+    return get_filter_cache().get_or_build(key, build)
+
+def session_aggregates(df):
+    """المؤشرات المجمعة لجدول الجلسة: المشتركة إن كانت لنفس إصداره، وإلا تُبنى منه"""
+    aggregates = get_dataset().aggregates
+    if aggregates.version != st.session_state.get('data_version'):
+        aggregates = FleetAggregates(df)
+    return aggregates
+
+def session_index(index):
+    """الفهرس إن كان لنفس إصدار جدول الجلسة، وإلا None"""
+    return index if index.version == st.session_state.get('data_version') else None
+
+def center_distances():
+    """مصفوفة المسافات المحفوظة بين المراكز (None إن لم تُحفظ بعد)"""
+    try:
+        return load_distances(DISTANCES_FILE)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        st.error(f"❌ خطأ في ملف المسافات: {str(e)}")
+        return None
+
+IMPORT_PROFILE_MODULES = ['maintenance_core', 'streamlit', 'plotly.express']
+
+EXCEL_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+ZIP_MIME = "application/zip"
+MIME_LABELS = {EXCEL_MIME: "Excel", ZIP_MIME: "ZIP"}
+
+def report_fingerprint(key, params=()):
+    """بصمة التقرير في الذاكرة المؤقتة: (النوع، المعايير، إصدار البيانات، اليوم)"""
+    # اليوم جزء من البصمة لأن حالة الصيانة في التقرير تتغير بمرور الأيام
+    return ReportCache.fingerprint(key, params, st.session_state.get('data_version'), datetime.now().date())
+
+def report_download_button(key, label, file_name, build, params=()):
+    """زر تنزيل لتقرير يُبنى عند الطلب فقط
+    
+    يظهر أولاً زر لتجهيز التقرير، ولا يُستدعى build إلا عند الضغط عليه.
+    الملف الناتج يُحفظ في ذاكرة التقارير المشتركة حسب (المعايير، إصدار
+    البيانات، اليوم)، فيظهر زر التنزيل مباشرة لأي مستخدم يطلب التقرير نفسه.
+    الإصابة تُحتسب عند تنزيل الملف المحفوظ فقط، لا عند كل إعادة عرض للصفحة.
+    """
+    cache = get_report_cache()
+    fingerprint = report_fingerprint(key, params)
+    
+    data = cache.peek(fingerprint)
+    if data is None:
+        if not st.button(f"📄 تجهيز {label}", key=f"prepare_{key}"):
+            return
+        with st.spinner("جاري تجهيز التقرير..."):
+            data = cache.get_or_build(fingerprint, build)
     
-    output.seek(0)
-    return output
+    if show_download_button(key, label, file_name, data):
+        cache.record_hit(fingerprint)
+
+def report_job_button(key, label, file_name, job, params=(), mime=EXCEL_MIME):
+    """مثل report_download_button لكن الملف يُبنى في عمليات خلفية
+    
+    job تُستدعى عند الضغط فقط وتُرجع (المهام الجزئية، دالة الضم) لطابور
+    المهام، ويُحفظ رقم المهمة في الجلسة فتبقى الواجهة متاحة أثناء البناء
+    ويُعرض زر التنزيل عند اكتمالها.
+    """
+    cache = get_report_cache()
+    fingerprint = report_fingerprint(key, params)
+    jobs = st.session_state.setdefault('report_jobs', {})
+    
+    data = cache.peek(fingerprint)
+    if data is None:
+        queue = get_job_queue()
+        if key not in jobs or jobs[key][0] != fingerprint:
+            if not st.button(f"📄 تجهيز {label}", key=f"prepare_{key}"):
+                return
+            cache.record_miss()
+            try:
+                jobs[key] = (fingerprint, queue.submit(label, *job()))
+            except Exception as e:
+                st.error(f"❌ تعذر تجهيز {label}: {str(e)}")
+                return
+        
+        job_id = jobs[key][1]
+        status = queue.status(job_id)
+        if status['state'] in ('queued', 'running'):
+            st.info(f"⏳ جاري تجهيز {label} في الخلفية... ({status['elapsed']:.0f} ثانية)")
+            if status['progress'] > 0:
+                st.progress(status['progress'])
+            st.button("🔄 تحديث الحالة", key=f"poll_{key}")
+            return
+        
+        del jobs[key]
+        if status['state'] != 'done':
+            st.error(f"❌ تعذر تجهيز {label}: {status.get('error') or 'المهمة غير موجودة'}")
+            return
+        data = queue.result(job_id)
+        cache.put(fingerprint, data)
+    
+    if show_download_button(key, label, file_name, data, mime):
+        cache.record_hit(fingerprint)
+
+def show_download_button(key, label, file_name, data, mime=EXCEL_MIME):
+    """زر تنزيل ملف التقرير الجاهز (True عند الضغط عليه)"""
+    return st.download_button(
+        label=f"📥 تحميل {label} ({MIME_LABELS[mime]})",
+        data=data,
+        file_name=file_name,
+        mime=mime,
+        key=f"download_{key}"
+    )
 
 # --- الواجهة الرئيسية ---
 def main():
@@ -212,16 +314,19 @@ def main():
         st.markdown("---")
         st.info("💡 **نصيحة**: استخدم الفلاتر لتخصيص العرض حسب احتياجاتك")
     
-    # تحميل البيانات
-    if 'df' not in st.session_state:
-        df = load_data('/mnt/user-data/uploads/All_Devices_Merged.xlsx')
-        if df is not None:
-            st.session_state.df = df
-        else:
-            st.error("فشل تحميل البيانات!")
-            return
+    # تحميل البيانات المشتركة
+    try:
+        dataset = get_dataset()
+    except RuntimeError:
+        st.error("فشل تحميل البيانات!")
+        return
     
-    df = st.session_state.df
+    # نسخة ثابتة لهذا التشغيل، ورقم إصدارها للتحقق السريع من التحديثات
+    df, version = dataset.snapshot()
+    seen_version = st.session_state.get('data_version')
+    if seen_version is not None and seen_version != version:
+        st.toast("🔄 تم تحديث البيانات")
+    st.session_state.data_version = version
     
     # --- لوحة المعلومات ---
     if menu == "📊 لوحة المعلومات":
@@ -245,6 +350,10 @@ def main():
 
 def show_dashboard(df):
     """عرض لوحة المعلومات الرئيسية"""
+    # plotly تُستورد عند فتح صفحات الرسوم فقط لتسريع بدء التطبيق
+    import plotly.express as px
+    import plotly.graph_objects as go
+    
     st.header("📊 لوحة المعلومات الشاملة")
     
     # الفلاتر
@@ -270,14 +379,12 @@ def show_dashboard(df):
             default=['عامل']
         )
     
-    # تطبيق الفلاتر
-    df_filtered = df.copy()
-    if selected_centers:
-        df_filtered = df_filtered[df_filtered['Center_Name'].isin(selected_centers)]
-    if selected_departments:
-        df_filtered = df_filtered[df_filtered['Scientific Department'].isin(selected_departments)]
-    if status_filter:
-        df_filtered = df_filtered[df_filtered['Device_Status'].isin(status_filter)]
+    # تطبيق الفلاتر (مواقع الصفوف فقط، والأعمدة تُقتطع عند العرض)
+    rows = filtered_rows(df, selected_centers, selected_departments, status_filter)
+    
+    # المؤشرات من الجدول المجمع بدلاً من مسح جميع الأجهزة
+    agg = session_aggregates(df).frame(selected_centers, selected_departments, status_filter)
+    total = count_by(agg)
     
     st.markdown("---")
     
@@ -287,15 +394,12 @@ def show_dashboard(df):
     with col1:
         st.metric(
             label="🏥 إجمالي الأجهزة",
-            value=len(df_filtered),
-            delta=f"{len(df_filtered[df_filtered['Device_Status']=='عامل'])} عامل"
+            value=total,
+            delta=f"{count_by(agg, 'Device_Status', 'عامل')} عامل"
         )
     
     with col2:
-        overdue = len(df_filtered[
-            (df_filtered['Next_Maintenance'] < pd.Timestamp.now()) & 
-            (df_filtered['Next_Maintenance'].notna())
-        ])
+        overdue = count_by(agg, 'Maintenance_Status', 'متأخر')
         st.metric(
             label="🔴 صيانات متأخرة",
             value=overdue,
@@ -304,11 +408,7 @@ def show_dashboard(df):
         )
     
     with col3:
-        urgent = len(df_filtered[
-            ((df_filtered['Next_Maintenance'] - pd.Timestamp.now()).dt.days <= 7) & 
-            (df_filtered['Next_Maintenance'] >= pd.Timestamp.now()) &
-            (df_filtered['Next_Maintenance'].notna())
-        ])
+        urgent = count_by(agg, 'Maintenance_Status', 'عاجل')
         st.metric(
             label="🟠 صيانات عاجلة",
             value=urgent,
@@ -316,11 +416,11 @@ def show_dashboard(df):
         )
     
     with col4:
-        broken = len(df_filtered[df_filtered['Device_Status'] == 'معطل'])
+        broken = count_by(agg, 'Device_Status', 'معطل')
         st.metric(
             label="⚠️ أجهزة معطلة",
             value=broken,
-            delta=f"{(broken/len(df_filtered)*100):.1f}%" if len(df_filtered) > 0 else "0%"
+            delta=f"{(broken/total*100):.1f}%" if total > 0 else "0%"
         )
     
     st.markdown("---")
@@ -330,7 +430,7 @@ def show_dashboard(df):
     
     with col1:
         st.subheader("📊 توزيع الأجهزة حسب المراكز")
-        center_counts = df_filtered['Center_Name'].value_counts().head(10)
+        center_counts = agg.groupby('Center_Name')['Count'].sum().sort_values(ascending=False).head(10)
         fig = px.bar(
             x=center_counts.values,
             y=center_counts.index,
@@ -344,10 +444,7 @@ def show_dashboard(df):
     
     with col2:
         st.subheader("🔧 حالة الصيانة")
-        df_filtered['Maintenance_Status'] = df_filtered.apply(
-            lambda row: calculate_maintenance_status(row)[0], axis=1
-        )
-        status_counts = df_filtered['Maintenance_Status'].value_counts()
+        status_counts = agg.groupby('Maintenance_Status')['Count'].sum().sort_values(ascending=False)
         
         colors = {
             'متأخر': '#ff4b4b',
@@ -368,16 +465,17 @@ def show_dashboard(df):
     
     # جدول الأجهزة التي تحتاج صيانة عاجلة
     st.subheader("🚨 أجهزة تحتاج صيانة فورية")
-    urgent_devices = df_filtered[
-        ((df_filtered['Next_Maintenance'] - pd.Timestamp.now()).dt.days <= 7) &
-        (df_filtered['Next_Maintenance'].notna())
-    ].sort_values('Next_Maintenance')
+    # المتأخر والعاجل (المتبقي له URGENT_DAYS يوماً أو أقل) كما في compute_maintenance_status
+    urgent = earliest_due(
+        df, rows, day_end() + pd.Timedelta(days=URGENT_DAYS + 1), 10,
+        due_index=session_index(get_dataset().due_index)
+    )
     
-    if len(urgent_devices) > 0:
+    if len(urgent) > 0:
         display_cols = ['Asset ID', 'Scientific Equipment Name', 'Center_Name', 
                        'Next_Maintenance', 'Device_Status', 'Priority']
         st.dataframe(
-            urgent_devices[display_cols].head(10),
+            take_rows(df, urgent, display_cols),
             use_container_width=True,
             hide_index=True
         )
@@ -395,42 +493,37 @@ def show_devices_management(df):
         
         col1, col2 = st.columns(2)
         with col1:
-            search_term = st.text_input("🔍 بحث (الاسم، الرقم التسلسلي، الموديل):")
+            search_term = st.text_input("🔍 بحث (الاسم، الرقم التسلسلي، الموديل، الشركة، Asset ID):")
         with col2:
             center_filter = st.selectbox(
                 "المركز:",
                 ['الكل'] + sorted(df['Center_Name'].dropna().unique().tolist())
             )
         
-        # تطبيق البحث
-        df_search = df.copy()
+        # تطبيق البحث من الفهرس (النتائج مرتبة حسب الصلة)
+        rows = filtered_rows(df, centers=[] if center_filter == 'الكل' else [center_filter])
         if search_term:
-            df_search = df_search[
-                df_search['Scientific Equipment Name'].str.contains(search_term, case=False, na=False) |
-                df_search['Serial No'].astype(str).str.contains(search_term, case=False, na=False) |
-                df_search['Model'].astype(str).str.contains(search_term, case=False, na=False)
-            ]
-        if center_filter != 'الكل':
-            df_search = df_search[df_search['Center_Name'] == center_filter]
+            positions = df.index.get_indexer(get_dataset().search(search_term))
+            rows = positions[np.isin(positions, rows)]
         
-        st.write(f"النتائج: {len(df_search)} جهاز")
+        st.write(f"النتائج: {len(rows)} جهاز")
         
-        if len(df_search) > 0:
+        if len(rows) > 0:
             # عرض النتائج
-            display_df = df_search[[
+            display_df = take_rows(df, rows, [
                 'Asset ID', 'Scientific Equipment Name', 'Manufacturer', 
                 'Model', 'Center_Name', 'Device_Status', 'Next_Maintenance'
-            ]].copy()
+            ])
             
             st.dataframe(display_df, use_container_width=True, hide_index=True)
             
             # تصدير النتائج
-            excel_data = export_maintenance_report(df_search)
-            st.download_button(
-                label="📥 تحميل النتائج (Excel)",
-                data=excel_data,
-                file_name=f"devices_search_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            report_download_button(
+                "devices_search",
+                "النتائج",
+                f"devices_search_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                lambda: export_maintenance_report(df.iloc[rows]),
+                params=(search_term, center_filter)
             )
     
     with tab2:
@@ -468,17 +561,9 @@ def show_devices_management(df):
             
             if submitted:
                 if equipment_name and center and department:
-                    # توليد Asset ID جديد
+                    # حجز Asset ID جديد من تسلسل المركز
                     center_code = CENTERS_DICT_REV[center]
-                    existing_ids = df[df['Center_Code'] == center_code]['Asset ID'].tolist()
-                    max_num = 0
-                    for asset_id in existing_ids:
-                        try:
-                            num = int(asset_id.split('-')[-1])
-                            max_num = max(max_num, num)
-                        except:
-                            pass
-                    new_asset_id = f"{center_code}-{max_num+1:03d}"
+                    new_asset_id = get_repository().next_asset_id(center_code)
                     
                     # إضافة الجهاز الجديد
                     new_row = {
@@ -501,9 +586,7 @@ def show_devices_management(df):
                         'Notes': notes
                     }
                     
-                    st.session_state.df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-                    
-                    if save_data(st.session_state.df, '/mnt/user-data/uploads/All_Devices_Merged.xlsx'):
+                    if add_device(new_row):
                         st.success(f"✅ تم إضافة الجهاز بنجاح! Asset ID: {new_asset_id}")
                         st.rerun()
                     else:
@@ -519,8 +602,8 @@ def show_devices_management(df):
             df['Asset ID'].tolist()
         )
         
-        if asset_id:
-            device = df[df['Asset ID'] == asset_id].iloc[0]
+        device = find_device(df, asset_id) if asset_id else None
+        if device is not None:
             
             with st.form("edit_device_form"):
                 col1, col2 = st.columns(2)
@@ -557,16 +640,17 @@ def show_devices_management(df):
                     delete_btn = st.form_submit_button("🗑️ حذف الجهاز", use_container_width=True, type="secondary")
                 
                 if update_btn:
-                    idx = df[df['Asset ID'] == asset_id].index[0]
-                    st.session_state.df.loc[idx, 'Scientific Equipment Name'] = equipment_name
-                    st.session_state.df.loc[idx, 'Manufacturer'] = manufacturer
-                    st.session_state.df.loc[idx, 'Model'] = model
-                    st.session_state.df.loc[idx, 'Device_Status'] = device_status
-                    st.session_state.df.loc[idx, 'Priority'] = priority
-                    st.session_state.df.loc[idx, 'Maintenance_Interval_Days'] = maintenance_interval
-                    st.session_state.df.loc[idx, 'Notes'] = notes
+                    changes = {
+                        'Scientific Equipment Name': equipment_name,
+                        'Manufacturer': manufacturer,
+                        'Model': model,
+                        'Device_Status': device_status,
+                        'Priority': priority,
+                        'Maintenance_Interval_Days': maintenance_interval,
+                        'Notes': notes
+                    }
                     
-                    if save_data(st.session_state.df, '/mnt/user-data/uploads/All_Devices_Merged.xlsx'):
+                    if update_device(asset_id, changes):
                         st.success("✅ تم حفظ التعديلات بنجاح!")
                         st.rerun()
                     else:
@@ -574,9 +658,7 @@ def show_devices_management(df):
                 
                 if delete_btn:
                     if st.checkbox("⚠️ أنا متأكد من حذف هذا الجهاز"):
-                        st.session_state.df = st.session_state.df[st.session_state.df['Asset ID'] != asset_id]
-                        
-                        if save_data(st.session_state.df, '/mnt/user-data/uploads/All_Devices_Merged.xlsx'):
+                        if delete_device(asset_id):
                             st.success("✅ تم حذف الجهاز بنجاح!")
                             st.rerun()
                         else:
@@ -584,9 +666,11 @@ def show_devices_management(df):
 
 def show_maintenance_schedule(df):
     """جدولة الصيانة"""
+    import plotly.express as px
+    
     st.header("🔧 جدولة وإدارة الصيانة")
     
-    tab1, tab2, tab3 = st.tabs(["📅 جدول الصيانة", "✅ تسجيل صيانة", "📊 إحصائيات الصيانة"])
+    tab1, tab2, tab3, tab4 = st.tabs(["📅 جدول الصيانة", "✅ تسجيل صيانة", "📊 إحصائيات الصيانة", "🗓️ خطة الزيارات"])
     
     with tab1:
         st.subheader("جدول الصيانة القادم")
@@ -596,7 +680,7 @@ def show_maintenance_schedule(df):
         with col1:
             time_range = st.selectbox(
                 "الفترة الزمنية:",
-                ['متأخر', 'خلال أسبوع', 'خلال شهر', 'خلال 3 شهور', 'الكل']
+                TIME_RANGES
             )
         with col2:
             priority_filter = st.multiselect(
@@ -611,51 +695,29 @@ def show_maintenance_schedule(df):
             )
         
         # تطبيق الفلاتر
-        df_schedule = df[df['Next_Maintenance'].notna()].copy()
-        
-        today = pd.Timestamp.now()
-        if time_range == 'متأخر':
-            df_schedule = df_schedule[df_schedule['Next_Maintenance'] < today]
-        elif time_range == 'خلال أسبوع':
-            df_schedule = df_schedule[
-                (df_schedule['Next_Maintenance'] >= today) &
-                (df_schedule['Next_Maintenance'] <= today + timedelta(days=7))
-            ]
-        elif time_range == 'خلال شهر':
-            df_schedule = df_schedule[
-                (df_schedule['Next_Maintenance'] >= today) &
-                (df_schedule['Next_Maintenance'] <= today + timedelta(days=30))
-            ]
-        elif time_range == 'خلال 3 شهور':
-            df_schedule = df_schedule[
-                (df_schedule['Next_Maintenance'] >= today) &
-                (df_schedule['Next_Maintenance'] <= today + timedelta(days=90))
-            ]
-        
-        if priority_filter:
-            df_schedule = df_schedule[df_schedule['Priority'].isin(priority_filter)]
-        
-        if center_filter != 'الكل':
-            df_schedule = df_schedule[df_schedule['Center_Name'] == center_filter]
-        
-        # إضافة حالة الصيانة
-        df_schedule['Status_Icon'] = df_schedule.apply(
-            lambda row: calculate_maintenance_status(row)[1], axis=1
+        rows = filtered_rows(
+            df,
+            centers=[] if center_filter == 'الكل' else [center_filter],
+            priorities=priority_filter,
+            time_range=time_range
         )
-        df_schedule['Days_Until'] = (df_schedule['Next_Maintenance'] - today).dt.days
         
         # ترتيب حسب الأولوية والموعد
-        df_schedule = df_schedule.sort_values(['Priority', 'Next_Maintenance'], 
-                                             ascending=[False, True])
+        rows = sort_rows(df, rows, ['Priority', 'Next_Maintenance'], ascending=[False, True])
         
-        st.write(f"عدد الأجهزة: {len(df_schedule)}")
+        st.write(f"عدد الأجهزة: {len(rows)}")
         
-        if len(df_schedule) > 0:
-            display_cols = ['Status_Icon', 'Asset ID', 'Scientific Equipment Name', 
-                          'Center_Name', 'Next_Maintenance', 'Days_Until', 'Priority']
+        if len(rows) > 0:
+            df_schedule = take_rows(df, rows, ['Asset ID', 'Scientific Equipment Name', 
+                                               'Center_Name', 'Next_Maintenance', 'Priority'])
+            
+            # إضافة حالة الصيانة
+            today = pd.Timestamp.now()
+            df_schedule.insert(0, 'Status_Icon', compute_maintenance_status(df_schedule, as_of=today)['Status_Icon'])
+            df_schedule.insert(5, 'Days_Until', (df_schedule['Next_Maintenance'] - today).dt.days)
             
             st.dataframe(
-                df_schedule[display_cols],
+                df_schedule,
                 use_container_width=True,
                 hide_index=True,
                 column_config={
@@ -666,12 +728,12 @@ def show_maintenance_schedule(df):
             )
             
             # تصدير الجدول
-            excel_data = export_maintenance_report(df_schedule)
-            st.download_button(
-                label="📥 تحميل جدول الصيانة (Excel)",
-                data=excel_data,
-                file_name=f"maintenance_schedule_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            report_download_button(
+                "maintenance_schedule",
+                "جدول الصيانة",
+                f"maintenance_schedule_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                lambda: export_maintenance_report(df.iloc[rows]),
+                params=(time_range, tuple(priority_filter), center_filter)
             )
         else:
             st.info("لا توجد أجهزة تطابق معايير البحث")
@@ -685,8 +747,8 @@ def show_maintenance_schedule(df):
             key="maintenance_asset_select"
         )
         
-        if asset_id:
-            device = df[df['Asset ID'] == asset_id].iloc[0]
+        device = find_device(df, asset_id) if asset_id else None
+        if device is not None:
             
             col1, col2 = st.columns(2)
             with col1:
@@ -698,6 +760,26 @@ def show_maintenance_schedule(df):
                 else:
                     st.warning("لم يتم تحديد موعد صيانة")
             
+            with st.expander("📜 سجل الصيانة السابق"):
+                history = get_repository().maintenance_history(asset_id)
+                if len(history) > 0:
+                    st.dataframe(
+                        history,
+                        use_container_width=True,
+                        hide_index=True,
+                        column_config={
+                            "Maintenance_Date": st.column_config.DateColumn("تاريخ الصيانة", format="DD/MM/YYYY"),
+                            "Maintenance_Type": "نوع الصيانة",
+                            "Technician": "الفني",
+                            "Parts_Replaced": "القطع المستبدلة",
+                            "Notes": "ملاحظات",
+                            "Status_After": "الحالة بعد الصيانة",
+                            "Recorded_At": None
+                        }
+                    )
+                else:
+                    st.info("لا يوجد سجل صيانة لهذا الجهاز")
+            
             with st.form("maintenance_log_form"):
                 maintenance_date = st.date_input(
                     "تاريخ الصيانة:",
@@ -730,20 +812,25 @@ def show_maintenance_schedule(df):
                 submitted = st.form_submit_button("💾 حفظ سجل الصيانة", use_container_width=True)
                 
                 if submitted:
-                    idx = df[df['Asset ID'] == asset_id].index[0]
+                    # سجل الصيانة يُحفظ في جدول مستقل بدلاً من إلحاقه بالملاحظات
+                    event = {
+                        'Maintenance_Date': pd.Timestamp(maintenance_date),
+                        'Maintenance_Type': maintenance_type,
+                        'Technician': technician,
+                        'Parts_Replaced': parts_replaced,
+                        'Notes': maintenance_notes,
+                        'Status_After': device_status_after
+                    }
                     
                     # تحديث البيانات
-                    st.session_state.df.loc[idx, 'Last_Maintenance'] = pd.Timestamp(maintenance_date)
-                    st.session_state.df.loc[idx, 'Next_Maintenance'] = pd.Timestamp(maintenance_date) + timedelta(days=next_maintenance_interval)
-                    st.session_state.df.loc[idx, 'Device_Status'] = device_status_after
-                    st.session_state.df.loc[idx, 'Maintenance_Interval_Days'] = next_maintenance_interval
-                    
-                    # تحديث الملاحظات
-                    current_notes = str(device['Notes']) if pd.notna(device['Notes']) else ''
-                    new_note = f"\n[{maintenance_date}] {maintenance_type} - {technician}: {maintenance_notes}"
-                    st.session_state.df.loc[idx, 'Notes'] = current_notes + new_note
+                    changes = {
+                        'Last_Maintenance': pd.Timestamp(maintenance_date),
+                        'Next_Maintenance': pd.Timestamp(maintenance_date) + timedelta(days=next_maintenance_interval),
+                        'Device_Status': device_status_after,
+                        'Maintenance_Interval_Days': next_maintenance_interval
+                    }
                     
-                    if save_data(st.session_state.df, '/mnt/user-data/uploads/All_Devices_Merged.xlsx'):
+                    if log_maintenance(asset_id, event, changes):
                         st.success(f"✅ تم تسجيل الصيانة بنجاح! الصيانة القادمة: {(pd.Timestamp(maintenance_date) + timedelta(days=next_maintenance_interval)).strftime('%Y-%m-%d')}")
                         st.rerun()
                     else:
@@ -755,32 +842,24 @@ def show_maintenance_schedule(df):
         # تحليل الصيانة
         col1, col2, col3 = st.columns(3)
         
+        overdue = filtered_rows(df, time_range='متأخر')
+        
         with col1:
-            completed = len(df[df['Last_Maintenance'].notna()])
+            completed = int(df['Last_Maintenance'].notna().sum())
             st.metric("✅ صيانات منجزة", completed)
         
         with col2:
-            pending = len(df[
-                (df['Next_Maintenance'] < pd.Timestamp.now()) &
-                (df['Next_Maintenance'].notna())
-            ])
-            st.metric("⏰ صيانات متأخرة", pending)
+            st.metric("⏰ صيانات متأخرة", len(overdue))
         
         with col3:
-            upcoming = len(df[
-                (df['Next_Maintenance'] >= pd.Timestamp.now()) &
-                (df['Next_Maintenance'] <= pd.Timestamp.now() + timedelta(days=30)) &
-                (df['Next_Maintenance'].notna())
-            ])
+            upcoming = len(filtered_rows(df, time_range='خلال شهر'))
             st.metric("📅 صيانات قادمة (30 يوم)", upcoming)
         
         # رسم بياني للصيانة حسب المراكز
         st.subheader("📊 الصيانة المتأخرة حسب المراكز")
         
-        overdue_by_center = df[
-            (df['Next_Maintenance'] < pd.Timestamp.now()) &
-            (df['Next_Maintenance'].notna())
-        ].groupby('Center_Name').size().sort_values(ascending=True)
+        overdue_by_center = df['Center_Name'].take(overdue).value_counts()
+        overdue_by_center = overdue_by_center[overdue_by_center > 0].sort_values(ascending=True)
         
         if len(overdue_by_center) > 0:
             fig = px.bar(
@@ -795,9 +874,136 @@ def show_maintenance_schedule(df):
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.success("✅ لا توجد صيانات متأخرة!")
+    
+    with tab4:
+        st.subheader("خطة زيارات الفنيين")
+        st.caption(
+            "توزيع الأجهزة المستحقة على أيام العمل: كل فني يزور مركزاً واحداً في اليوم، "
+            "والخطة توازن عدد الأجهزة بين الأيام ضمن المهلة المسموحة لكل جهاز. "
+            "مع مصفوفة المسافات تُجمع زيارات اليوم في مسارات بين المراكز."
+        )
+        
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            technicians = st.number_input("عدد الفنيين:", min_value=1, max_value=500, value=4)
+        with col2:
+            per_technician = st.number_input("أجهزة لكل فني يومياً:", min_value=1, max_value=100, value=8)
+        with col3:
+            horizon = st.number_input("مدة الخطة (أيام):", min_value=7, max_value=180, value=30)
+        with col4:
+            early_days = st.number_input("الزيارة المبكرة حتى (أيام):", min_value=0, max_value=60, value=7)
+        
+        holidays = st.multiselect(
+            "إجازات رسمية:",
+            pd.date_range(datetime.now().date(), periods=horizon).date.tolist(),
+            format_func=lambda day: day.strftime('%Y-%m-%d')
+        )
+        
+        with st.expander("🗺️ مسارات بين المراكز"):
+            st.caption(
+                f"ملف CSV مربع بالكيلومترات: الصفوف والأعمدة رموز المراكز (مثل KHL-PHC) "
+                f"ومقر انطلاق الفنيين باسم {DEPOT_CODE}."
+            )
+            uploaded_distances = st.file_uploader("مصفوفة المسافات:", type=['csv'])
+            if uploaded_distances and st.button("💾 حفظ مصفوفة المسافات"):
+                try:
+                    load_distances(uploaded_distances).to_csv(DISTANCES_FILE)
+                    st.success("✅ تم حفظ مصفوفة المسافات")
+                except Exception as e:
+                    st.error(f"❌ خطأ في ملف المسافات: {str(e)}")
+            
+            distances = center_distances()
+            use_routes = st.checkbox(
+                "تجميع الزيارات في مسارات",
+                value=distances is not None,
+                disabled=distances is None
+            )
+            max_route_km = st.number_input("أقصى مسافة للمسار (كم، 0 = بلا حد):", min_value=0, max_value=5000, value=0)
+        
+        use_routes = use_routes and distances is not None
+        params = (technicians, per_technician, horizon, early_days, tuple(holidays), use_routes, max_route_km,
+                  pd.util.hash_pandas_object(distances).sum() if use_routes else None)
+        plan_key = (st.session_state.get('data_version'), datetime.now().date(), params)
+        if st.button("🗓️ إنشاء الخطة", type="primary"):
+            if use_routes:
+                planner = RoutePlanner(distances, technicians, per_technician, early_days,
+                                       holidays=holidays, max_route_km=max_route_km or None)
+            else:
+                planner = VisitPlanner(technicians, per_technician, early_days, holidays=holidays)
+            with st.spinner("جاري إعداد الخطة..."):
+                try:
+                    plan = planner.plan(df, horizon_days=horizon)
+                    routes = planner.summary(plan) if use_routes else None
+                    st.session_state.visit_plan = (plan_key, plan, routes)
+                except ValueError as e:
+                    st.error(f"❌ {str(e)}")
+        
+        if st.session_state.get('visit_plan', (None,))[0] == plan_key:
+            _, plan, routes = st.session_state.visit_plan
+            load = daily_load(plan)
+            
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("📋 أجهزة في الخطة", int(plan['Planned_Date'].notna().sum()))
+            with col2:
+                if routes is None:
+                    st.metric("🚐 زيارات", int(load['Trips'].sum()))
+                else:
+                    st.metric("🛣️ مسارات", len(routes), f"{routes['Distance_km'].sum():,.0f} كم", delta_color="off")
+            with col3:
+                st.metric("⏰ بعد المهلة", int(plan['Late'].sum()))
+            with col4:
+                st.metric("❔ خارج الخطة", int(plan['Planned_Date'].isna().sum()))
+            
+            if len(load) > 0:
+                fig = px.bar(
+                    load.reset_index(),
+                    x='Planned_Date',
+                    y='Devices',
+                    hover_data=['Trips', 'Centers'],
+                    labels={'Planned_Date': 'اليوم', 'Devices': 'عدد الأجهزة'}
+                )
+                fig.add_hline(y=technicians * per_technician, line_dash="dash", line_color="red")
+                st.plotly_chart(fig, use_container_width=True)
+            
+            if routes is not None:
+                st.dataframe(
+                    routes,
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={
+                        "Planned_Date": st.column_config.DateColumn("اليوم", format="DD/MM/YYYY"),
+                        "Technician": st.column_config.NumberColumn("الفني"),
+                        "Route": st.column_config.TextColumn("المسار"),
+                        "Distance_km": st.column_config.NumberColumn("المسافة", format="%.1f كم")
+                    }
+                )
+            
+            st.dataframe(
+                plan,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Planned_Date": st.column_config.DateColumn("يوم الزيارة", format="DD/MM/YYYY"),
+                    "Technician": st.column_config.NumberColumn("الفني"),
+                    "Next_Maintenance": st.column_config.DateColumn("موعد الصيانة", format="DD/MM/YYYY"),
+                    "Late": st.column_config.CheckboxColumn("بعد المهلة")
+                }
+            )
+            
+            report_download_button(
+                "visit_plan",
+                "خطة الزيارات",
+                f"visit_plan_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                lambda: export_maintenance_report(plan),
+                params=params
+            )
 
 def show_reports(df):
     """التقارير والإحصائيات"""
+    import plotly.express as px
+    import plotly.graph_objects as go
+    
     st.header("📈 التقارير والإحصائيات")
     
     tab1, tab2, tab3 = st.tabs(["📊 تقرير شامل", "🏥 تقرير المراكز", "📋 تقارير مخصصة"])
@@ -806,25 +1012,24 @@ def show_reports(df):
         st.subheader("التقرير الشامل للأجهزة والصيانة")
         
         # إحصائيات عامة
+        agg = session_aggregates(df).frame()
+        total = count_by(agg)
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            st.metric("إجمالي الأجهزة", len(df))
-            st.metric("الأجهزة العاملة", len(df[df['Device_Status'] == 'عامل']))
+            st.metric("إجمالي الأجهزة", total)
+            st.metric("الأجهزة العاملة", count_by(agg, 'Device_Status', 'عامل'))
         
         with col2:
-            st.metric("الأجهزة المعطلة", len(df[df['Device_Status'] == 'معطل']))
-            st.metric("تحت الصيانة", len(df[df['Device_Status'] == 'تحت الصيانة']))
+            st.metric("الأجهزة المعطلة", count_by(agg, 'Device_Status', 'معطل'))
+            st.metric("تحت الصيانة", count_by(agg, 'Device_Status', 'تحت الصيانة'))
         
         with col3:
-            overdue = len(df[
-                (df['Next_Maintenance'] < pd.Timestamp.now()) &
-                (df['Next_Maintenance'].notna())
-            ])
-            st.metric("صيانات متأخرة", overdue, delta=f"{(overdue/len(df)*100):.1f}%")
+            overdue = count_by(agg, 'Maintenance_Status', 'متأخر')
+            st.metric("صيانات متأخرة", overdue, delta=f"{(overdue/total*100):.1f}%")
         
         with col4:
-            avg_interval = df['Maintenance_Interval_Days'].mean()
+            avg_interval = agg['Interval_Sum'].sum() / total if total > 0 else 0
             st.metric("متوسط فترة الصيانة", f"{avg_interval:.0f} يوم")
         
         st.markdown("---")
@@ -834,7 +1039,7 @@ def show_reports(df):
         
         with col1:
             st.subheader("📊 توزيع الأجهزة حسب القسم")
-            dept_counts = df['Scientific Department'].value_counts().head(10)
+            dept_counts = agg.groupby('Scientific Department')['Count'].sum().sort_values(ascending=False).head(10)
             fig = px.pie(
                 values=dept_counts.values,
                 names=dept_counts.index,
@@ -845,7 +1050,7 @@ def show_reports(df):
         
         with col2:
             st.subheader("🔧 حالة الأجهزة")
-            status_counts = df['Device_Status'].value_counts()
+            status_counts = agg.groupby('Device_Status')['Count'].sum().sort_values(ascending=False)
             fig = go.Figure(data=[go.Bar(
                 x=status_counts.index,
                 y=status_counts.values,
@@ -856,12 +1061,11 @@ def show_reports(df):
         
         # تصدير التقرير الشامل
         st.markdown("---")
-        excel_data = export_maintenance_report(df)
-        st.download_button(
-            label="📥 تحميل التقرير الشامل (Excel)",
-            data=excel_data,
-            file_name=f"comprehensive_report_{datetime.now().strftime('%Y%m%d')}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        report_job_button(
+            "comprehensive_report",
+            "التقرير الشامل",
+            f"comprehensive_report_{datetime.now().strftime('%Y%m%d')}.xlsx",
+            lambda: report_job(df)
         )
     
     with tab2:
@@ -873,30 +1077,27 @@ def show_reports(df):
         )
         
         if selected_center:
-            df_center = df[df['Center_Name'] == selected_center]
-            
             st.markdown(f"### 🏥 {selected_center}")
             st.markdown("---")
             
             # إحصائيات المركز
+            agg_center = session_aggregates(df).frame(centers=[selected_center])
+            center_total = count_by(agg_center)
             col1, col2, col3, col4 = st.columns(4)
             
             with col1:
-                st.metric("إجمالي الأجهزة", len(df_center))
+                st.metric("إجمالي الأجهزة", center_total)
             
             with col2:
-                working = len(df_center[df_center['Device_Status'] == 'عامل'])
-                st.metric("أجهزة عاملة", working, delta=f"{(working/len(df_center)*100):.1f}%")
+                working = count_by(agg_center, 'Device_Status', 'عامل')
+                st.metric("أجهزة عاملة", working, delta=f"{(working/center_total*100):.1f}%")
             
             with col3:
-                broken = len(df_center[df_center['Device_Status'] == 'معطل'])
-                st.metric("أجهزة معطلة", broken, delta=f"{(broken/len(df_center)*100):.1f}%")
+                broken = count_by(agg_center, 'Device_Status', 'معطل')
+                st.metric("أجهزة معطلة", broken, delta=f"{(broken/center_total*100):.1f}%")
             
             with col4:
-                overdue = len(df_center[
-                    (df_center['Next_Maintenance'] < pd.Timestamp.now()) &
-                    (df_center['Next_Maintenance'].notna())
-                ])
+                overdue = count_by(agg_center, 'Maintenance_Status', 'متأخر')
                 st.metric("صيانات متأخرة", overdue)
             
             st.markdown("---")
@@ -905,16 +1106,28 @@ def show_reports(df):
             st.subheader("قائمة الأجهزة")
             display_cols = ['Asset ID', 'Scientific Equipment Name', 'Scientific Department',
                           'Device_Status', 'Next_Maintenance', 'Priority']
-            st.dataframe(df_center[display_cols], use_container_width=True, hide_index=True)
+            center_rows = filtered_rows(df, centers=[selected_center])
+            st.dataframe(take_rows(df, center_rows, display_cols), use_container_width=True, hide_index=True)
             
             # تصدير تقرير المركز
-            excel_data = export_maintenance_report(df_center, selected_center)
-            st.download_button(
-                label=f"📥 تحميل تقرير {selected_center} (Excel)",
-                data=excel_data,
-                file_name=f"report_{selected_center}_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            report_download_button(
+                "center_report",
+                f"تقرير {selected_center}",
+                f"report_{selected_center}_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                lambda: export_maintenance_report(df, selected_center),
+                params=(selected_center,)
             )
+        
+        # تقارير كل المراكز دفعة واحدة
+        st.markdown("---")
+        st.subheader("📦 تقارير جميع المراكز")
+        report_job_button(
+            "center_reports_zip",
+            "تقارير جميع المراكز",
+            f"center_reports_{datetime.now().strftime('%Y%m%d')}.zip",
+            lambda: center_reports_job(df),
+            mime=ZIP_MIME
+        )
     
     with tab3:
         st.subheader("تقارير مخصصة")
@@ -950,76 +1163,129 @@ def show_reports(df):
             )
         
         # تطبيق الفلاتر
-        df_custom = df.copy()
-        if report_centers:
-            df_custom = df_custom[df_custom['Center_Name'].isin(report_centers)]
-        if report_departments:
-            df_custom = df_custom[df_custom['Scientific Department'].isin(report_departments)]
-        if report_status:
-            df_custom = df_custom[df_custom['Device_Status'].isin(report_status)]
-        if report_priority:
-            df_custom = df_custom[df_custom['Priority'].isin(report_priority)]
-        
-        st.write(f"**عدد الأجهزة في التقرير:** {len(df_custom)}")
-        
-        if len(df_custom) > 0:
+        rows = filtered_rows(df, report_centers, report_departments, report_status, report_priority)
+        
+        st.write(f"**عدد الأجهزة في التقرير:** {len(rows)}")
+        
+        if len(rows) > 0:
             st.dataframe(
-                df_custom[['Asset ID', 'Scientific Equipment Name', 'Center_Name', 
-                          'Device_Status', 'Next_Maintenance']],
+                take_rows(df, rows, ['Asset ID', 'Scientific Equipment Name', 'Center_Name', 
+                                     'Device_Status', 'Next_Maintenance']),
                 use_container_width=True,
                 hide_index=True
             )
             
-            excel_data = export_maintenance_report(df_custom)
-            st.download_button(
-                label="📥 تحميل التقرير المخصص (Excel)",
-                data=excel_data,
-                file_name=f"custom_report_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            report_download_button(
+                "custom_report",
+                "التقرير المخصص",
+                f"custom_report_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                lambda: export_maintenance_report(df.iloc[rows]),
+                params=(tuple(report_centers), tuple(report_departments),
+                        tuple(report_status), tuple(report_priority))
             )
 
 def show_settings(df):
     """الإعدادات"""
     st.header("⚙️ إعدادات النظام")
     
-    tab1, tab2, tab3 = st.tabs(["🔄 الصيانة الدورية", "📧 الإشعارات", "💾 النسخ الاحتياطي"])
+    tab1, tab2, tab3, tab4 = st.tabs(["🔄 الصيانة الدورية", "📧 الإشعارات", "💾 النسخ الاحتياطي", "🧠 استهلاك الذاكرة"])
     
     with tab1:
         st.subheader("إعدادات الصيانة الدورية الافتراضية")
         
         st.info("قم بتعيين فترات الصيانة الافتراضية لأنواع الأجهزة المختلفة")
         
-        equipment_types = df['Scientific Equipment Name'].dropna().unique()
+        intervals = current_intervals(df)
         
         selected_equipment = st.selectbox(
             "اختر نوع الجهاز:",
-            sorted(equipment_types)
+            intervals.index.tolist()
         )
         
         if selected_equipment:
-            devices = df[df['Scientific Equipment Name'] == selected_equipment]
-            current_interval = devices['Maintenance_Interval_Days'].mode()[0] if len(devices) > 0 else 90
-            
             new_interval = st.number_input(
                 f"فترة الصيانة لـ {selected_equipment} (بالأيام):",
                 min_value=7,
                 max_value=365,
-                value=int(current_interval)
+                value=int(intervals[selected_equipment])
             )
             
             if st.button("✅ تطبيق على جميع الأجهزة من هذا النوع"):
-                mask = st.session_state.df['Scientific Equipment Name'] == selected_equipment
-                st.session_state.df.loc[mask, 'Maintenance_Interval_Days'] = new_interval
-                
-                # تحديث مواعيد الصيانة القادمة
-                for idx in st.session_state.df[mask].index:
-                    last_maint = st.session_state.df.loc[idx, 'Last_Maintenance']
-                    if pd.notna(last_maint):
-                        st.session_state.df.loc[idx, 'Next_Maintenance'] = last_maint + timedelta(days=new_interval)
-                
-                if save_data(st.session_state.df, '/mnt/user-data/uploads/All_Devices_Merged.xlsx'):
-                    st.success(f"✅ تم تحديث فترة الصيانة لـ {len(devices)} جهاز")
+                rows = interval_updates(df, {selected_equipment: new_interval})
+                if save_rows(rows):
+                    st.success(f"✅ تم تحديث فترة الصيانة لـ {len(rows)} جهاز")
                     st.rerun()
+        
+        # سياسة كاملة: فترة لكل نوع جهاز تُطبق بعملية واحدة
+        with st.expander("📋 تطبيق سياسة فترات لجميع الأنواع"):
+            policy = st.data_editor(
+                intervals.rename('Interval').reset_index(),
+                use_container_width=True,
+                hide_index=True,
+                disabled=['Scientific Equipment Name'],
+                column_config={
+                    "Scientific Equipment Name": st.column_config.TextColumn("نوع الجهاز"),
+                    "Interval": st.column_config.NumberColumn("الفترة (أيام)", min_value=7, max_value=365, step=1)
+                },
+                key="interval_policy"
+            )
+            changed = policy[policy['Interval'].notna() & (policy['Interval'] != intervals.to_numpy())]
+            
+            if st.button(f"✅ تطبيق السياسة ({len(changed)} نوع معدل)", disabled=len(changed) == 0):
+                rows = interval_updates(df, zip(changed['Scientific Equipment Name'], changed['Interval']))
+                if save_rows(rows):
+                    st.success(f"✅ تم تحديث فترة الصيانة لـ {len(rows)} جهاز")
+                    st.rerun()
+        
+        # قواعد السياسة حسب نوع الجهاز والقسم والأولوية
+        st.markdown("---")
+        st.subheader("📜 قواعد سياسة الصيانة")
+        st.caption("نمط الاسم يقبل * و ? (مثل *X-Ray*)، والحقل الفارغ يطابق أي قيمة. "
+                   "إذا طابق الجهاز أكثر من قاعدة تُطبق الأكثر تحديداً ثم الأسبق.")
+        
+        repository = get_repository()
+        rules = st.data_editor(
+            repository.read_policy(),
+            num_rows="dynamic",
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "Name_Pattern": st.column_config.TextColumn("نمط اسم الجهاز"),
+                "Department": st.column_config.SelectboxColumn(
+                    "القسم", options=sorted(df['Scientific Department'].dropna().unique())
+                ),
+                "Priority": st.column_config.SelectboxColumn("الأولوية", options=['عالي', 'متوسط', 'منخفض']),
+                "Interval_Days": st.column_config.NumberColumn("الفترة (أيام)", min_value=7, max_value=365, step=1)
+            },
+            key="policy_rules"
+        )
+        policy = MaintenancePolicy(rules)
+        deviations = policy.deviations(df)
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("💾 حفظ القواعد", use_container_width=True):
+                repository.write_policy(policy.table)
+                st.success(f"✅ تم حفظ {len(policy.table)} قاعدة")
+        with col2:
+            if st.button(f"✅ تطبيق على الأجهزة المخالفة ({len(deviations)})",
+                         disabled=len(deviations) == 0, use_container_width=True):
+                repository.write_policy(policy.table)
+                if save_rows(policy.updates(df)):
+                    st.success(f"✅ تم تحديث فترة الصيانة لـ {len(deviations)} جهاز")
+                    st.rerun()
+        
+        if len(deviations) > 0:
+            st.write(f"**أجهزة مخالفة للسياسة:** {len(deviations)}")
+            st.dataframe(
+                deviations,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Maintenance_Interval_Days": st.column_config.NumberColumn("الفترة الحالية"),
+                    "Policy_Interval": st.column_config.NumberColumn("فترة السياسة")
+                }
+            )
     
     with tab2:
         st.subheader("إعدادات الإشعارات")
@@ -1048,15 +1314,12 @@ def show_settings(df):
         
         with col1:
             st.markdown("### 💾 نسخ احتياطي")
-            if st.button("إنشاء نسخة احتياطية الآن", use_container_width=True):
-                backup_data = export_maintenance_report(df)
-                st.download_button(
-                    label="📥 تحميل النسخة الاحتياطية",
-                    data=backup_data,
-                    file_name=f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    use_container_width=True
-                )
+            report_job_button(
+                "backup",
+                "النسخة الاحتياطية",
+                f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+                lambda: report_job(df)
+            )
         
         with col2:
             st.markdown("### 📤 استعادة البيانات")
@@ -1068,12 +1331,72 @@ def show_settings(df):
             if uploaded_backup:
                 if st.button("⚠️ استعادة البيانات", use_container_width=True):
                     try:
-                        restored_df = pd.read_excel(uploaded_backup)
-                        st.session_state.df = restored_df
+                        restored_df = prepare_data(pd.read_excel(uploaded_backup))
+                        get_dataset().replace(restored_df)
                         st.success("✅ تم استعادة البيانات بنجاح!")
                         st.rerun()
                     except Exception as e:
                         st.error(f"❌ خطأ في استعادة البيانات: {e}")
+    
+    with tab4:
+        st.subheader("استهلاك الذاكرة لبيانات الأجهزة")
+        
+        st.info("مقارنة حجم كل عمود بالأنواع العامة (قبل) وبمخطط الأنواع المضغوط (بعد)")
+        
+        report = memory_report(df)
+        total = report.loc['الإجمالي']
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("قبل", f"{total['Before_KB']:,.0f} KB")
+        with col2:
+            st.metric("بعد", f"{total['After_KB']:,.0f} KB")
+        with col3:
+            st.metric("التوفير", f"{total['Saved_%']:.1f}%")
+        
+        st.dataframe(
+            report,
+            use_container_width=True,
+            column_config={
+                "Before_KB": st.column_config.NumberColumn("قبل (KB)"),
+                "After_KB": st.column_config.NumberColumn("بعد (KB)"),
+                "Saved_%": st.column_config.NumberColumn("التوفير", format="%.1f%%")
+            }
+        )
+        
+        st.markdown("### 📄 ذاكرة التقارير المؤقتة")
+        show_cache_stats(get_report_cache())
+        
+        st.markdown("### 🔎 ذاكرة نتائج التصفية")
+        show_cache_stats(get_filter_cache())
+        
+        st.markdown("### ⏱️ زمن استيراد الوحدات")
+        st.caption("قياس مثل python -X importtime في عملية جديدة، مرتب حسب الزمن التراكمي")
+        if st.button("قياس زمن الاستيراد"):
+            with st.spinner("جاري القياس..."):
+                profile = import_profile(IMPORT_PROFILE_MODULES)
+            st.dataframe(
+                profile,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Cumulative_ms": st.column_config.NumberColumn("التراكمي (ms)", format="%.1f"),
+                    "Self_ms": st.column_config.NumberColumn("الذاتي (ms)", format="%.1f")
+                }
+            )
+
+def show_cache_stats(cache):
+    """مؤشرات استخدام ذاكرة مؤقتة (العناصر، الحجم، الإصابات، المحذوف)"""
+    cache_stats = cache.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("عناصر محفوظة", cache_stats['entries'])
+    with col2:
+        st.metric("الحجم", f"{cache_stats['size'] / 1024:,.0f} KB")
+    with col3:
+        st.metric("إصابات / إخفاقات", f"{cache_stats['hits']} / {cache_stats['misses']}")
+    with col4:
+        st.metric("عناصر محذوفة", cache_stats['evictions'])
 
 # --- تشغيل البرنامج ---
 if __name__ == "__main__":
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+اختبار حفظ الصفوف المعدلة عبر FleetDataset: الصفوف تُطابق برقم Asset ID،
+والذاكرة والمستودع يبقيان متطابقين حتى مع صفوف من نسخة أقدم من الجدول،
+وأرقام صفوف الأجهزة المحذوفة لا تُعاد لأجهزة جديدة.
+
+    python -m unittest
+"""
+
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from maintenance_core import (
+    DERIVED_COLUMNS, DeviceRepository, ExcelStore, FleetDataset, prepare_data, schedule_updates
+)
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'All_Devices_Merged.xlsx')
+
+class SaveRowsTest(unittest.TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.sample = prepare_data(ExcelStore(SAMPLE_FILE).read())
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        repository = DeviceRepository(os.path.join(self.tmp.name, 'devices.db'))
+        repository.write(self.sample.drop(columns=DERIVED_COLUMNS))
+        self.dataset = FleetDataset(self.sample.copy(), repository)
+    
+    def tearDown(self):
+        self.dataset.repository.conn.close()
+        self.tmp.cleanup()
+    
+    def interval_rows(self, df, labels, interval):
+        return schedule_updates(df, pd.Series(interval, index=labels))
+    
+    def assert_interval(self, asset_id, interval):
+        df = self.dataset.df
+        in_memory = df.loc[df['Asset ID'] == asset_id, 'Maintenance_Interval_Days']
+        self.assertEqual(in_memory.tolist(), [interval], asset_id)
+        self.assertEqual(self.dataset.repository.get(asset_id)['Maintenance_Interval_Days'], interval, asset_id)
+    
+    def test_deleted_devices_are_skipped(self):
+        df = self.dataset.df
+        rows = self.interval_rows(df, df.index[:3], 45)
+        deleted = rows['Asset ID'].iat[1]
+        self.dataset.delete(deleted)
+        
+        self.dataset.save_rows(rows)
+        self.assertIsNone(self.dataset.repository.get(deleted))
+        for asset_id in rows['Asset ID'].drop(rows.index[1]):
+            self.assert_interval(asset_id, 45)
+    
+    def test_rows_are_matched_by_asset_id(self):
+        df = self.dataset.df
+        first, second = df['Asset ID'].iat[0], df['Asset ID'].iat[1]
+        rows = pd.concat([self.interval_rows(df, [0], 45), self.interval_rows(df, [1], 60)])
+        # فهرس قديم لا يطابق الجدول الحالي
+        rows.index = [1, 0]
+        
+        self.dataset.save_rows(rows)
+        self.assert_interval(first, 45)
+        self.assert_interval(second, 60)
+    
+    def test_failed_update_is_not_saved(self):
+        df = self.dataset.df
+        asset_id = df['Asset ID'].iat[0]
+        before = self.dataset.repository.get(asset_id)['Maintenance_Interval_Days']
+        rows = self.interval_rows(df, [0], 45).assign(Next_Maintenance='ليس تاريخاً')
+        
+        with self.assertRaises(Exception):
+            self.dataset.save_rows(rows)
+        self.assert_interval(asset_id, before)
+    
+    def test_deleted_label_is_not_reused(self):
+        df = self.dataset.df
+        last = df.index[-1]
+        deleted = df['Asset ID'].iat[-1]
+        rows = self.interval_rows(df, [last], 45)
+        self.dataset.delete(deleted)
+        
+        record = df.iloc[0].drop(DERIVED_COLUMNS).to_dict()
+        record['Asset ID'] = 'TEST-0001'
+        self.dataset.add(record)
+        self.assertGreater(self.dataset.locate('TEST-0001'), last)
+        
+        # صفوف محفوظة قبل الحذف لا تصل إلى الجهاز الجديد
+        self.dataset.save_rows(rows)
+        self.assert_interval('TEST-0001', record['Maintenance_Interval_Days'])
+
+if __name__ == '__main__':
+    unittest.main()
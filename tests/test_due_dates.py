@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+اختبار اتساق مواعيد الصيانة: فلتر الفترة الزمنية (due_mask وDueIndex) وحالة
+الصيانة في المؤشرات المجمعة يعدّان الأجهزة نفسها، ومنها المستحق اليوم.
+
+    python -m unittest
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from maintenance_core import (
+    TIME_RANGES, DueIndex, FleetAggregates, count_by, filter_rows
+)
+
+# الفترة الزمنية في الفلتر ← حالات الصيانة المقابلة في المؤشرات
+RANGE_STATUSES = {
+    'متأخر': ['متأخر'],
+    'خلال أسبوع': ['عاجل'],
+    'خلال شهر': ['عاجل', 'قريب'],
+}
+
+class DueDatesTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.today = pd.Timestamp.now().normalize()
+        offsets = ['-1D', '0h', '15h', '23h59min', '1D', '1D12h', '7D', '7D23h', '8D', '30D', '31D', '90D']
+        dates = [self.today + pd.Timedelta(offset) for offset in offsets] + [pd.NaT]
+        self.df = pd.DataFrame({
+            'Center_Name': 'مركز',
+            'Scientific Department': 'قسم',
+            'Device_Status': 'عامل',
+            'Priority': 'متوسط',
+            'Next_Maintenance': pd.to_datetime(dates),
+            'Maintenance_Interval_Days': 90,
+        })
+        self.due_index = DueIndex.build(self.df)
+    
+    def as_of_times(self):
+        return [self.today, self.today + pd.Timedelta('9h30min'), self.today + pd.Timedelta('23h59min')]
+    
+    def test_due_today_is_overdue(self):
+        for as_of in self.as_of_times():
+            due_today = self.df['Next_Maintenance'].between(self.today, self.today + pd.Timedelta('23h59min'))
+            rows = filter_rows(self.df, time_range='متأخر', as_of=as_of)
+            self.assertTrue(set(np.flatnonzero(due_today.to_numpy())) <= set(rows), as_of)
+    
+    def test_filter_matches_aggregates(self):
+        for as_of in self.as_of_times():
+            agg = FleetAggregates(self.df, as_of).frame()
+            for time_range, statuses in RANGE_STATUSES.items():
+                expected = sum(count_by(agg, 'Maintenance_Status', status) for status in statuses)
+                rows = filter_rows(self.df, time_range=time_range, as_of=as_of)
+                self.assertEqual(len(rows), expected, (as_of, time_range))
+    
+    def test_ranges_match_index(self):
+        for as_of in self.as_of_times():
+            for time_range in TIME_RANGES:
+                scanned = filter_rows(self.df, time_range=time_range, as_of=as_of)
+                indexed = filter_rows(self.df, time_range=time_range, as_of=as_of, due_index=self.due_index)
+                self.assertEqual(sorted(indexed), sorted(scanned), (as_of, time_range))
+
+if __name__ == '__main__':
+    unittest.main()
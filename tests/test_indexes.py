@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+اختبار صيانة الفهارس تدريجياً: عمليات عشوائية عبر FleetDataset ثم مقارنة
+كل فهرس بإعادة بنائه من الجدول الناتج.
+
+    python -m unittest
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from maintenance_core import (
+    BITMAP_COLUMNS, CENTERS, DERIVED_COLUMNS, TIME_RANGES, BitmapIndex, DeviceRepository, DueIndex,
+    ExcelStore, FleetDataset, prepare_data
+)
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'All_Devices_Merged.xlsx')
+STEPS = 60
+
+class IndexUpkeepTest(unittest.TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.sample = prepare_data(ExcelStore(SAMPLE_FILE).read())
+    
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.today = pd.Timestamp.now().normalize()
+        df = self.sample.copy()
+        df['Next_Maintenance'] = self.random_dates(len(df))
+        
+        self.tmp = tempfile.TemporaryDirectory()
+        repository = DeviceRepository(os.path.join(self.tmp.name, 'devices.db'))
+        repository.write(df.drop(columns=DERIVED_COLUMNS))
+        self.dataset = FleetDataset(df, repository)
+        self.added = 0
+    
+    def tearDown(self):
+        self.dataset.repository.conn.close()
+        self.tmp.cleanup()
+    
+    def random_dates(self, size):
+        days = self.rng.integers(-30, 120, size)
+        dates = pd.Series(self.today + pd.to_timedelta(days, unit='D'))
+        # بعض الأجهزة بلا موعد
+        return dates.mask(self.rng.random(size) < 0.1)
+    
+    def random_asset(self):
+        ids = self.dataset.df['Asset ID']
+        return ids.iat[self.rng.integers(len(ids))]
+    
+    def random_changes(self):
+        return {
+            'Center_Name': CENTERS[self.rng.integers(len(CENTERS))][0],
+            'Device_Status': self.rng.choice(['عامل', 'معطل', 'تحت الصيانة']),
+            'Priority': self.rng.choice(['عالي', 'متوسط', 'منخفض']),
+            'Next_Maintenance': self.random_dates(1).iat[0],
+        }
+    
+    def random_operation(self):
+        dataset = self.dataset
+        operation = self.rng.choice(['add', 'update', 'log', 'delete', 'save_rows'])
+        if operation == 'add':
+            record = dataset.df.iloc[self.rng.integers(len(dataset.df))].to_dict()
+            record = {col: value for col, value in record.items() if col not in DERIVED_COLUMNS}
+            record.update(self.random_changes(), **{'Asset ID': f"TEST-{self.added:04d}"})
+            self.added += 1
+            dataset.add(record)
+        elif operation == 'update':
+            changes = self.random_changes()
+            keys = self.rng.choice(list(changes), self.rng.integers(1, len(changes) + 1), replace=False)
+            dataset.update(self.random_asset(), {key: changes[key] for key in keys})
+        elif operation == 'log':
+            event = {'Maintenance_Date': self.today, 'Maintenance_Type': 'وقائية'}
+            changes = {'Last_Maintenance': self.today, 'Next_Maintenance': self.random_dates(1).iat[0]}
+            dataset.log_maintenance(self.random_asset(), event, changes)
+        elif operation == 'delete':
+            dataset.delete(self.random_asset())
+        else:
+            rows = dataset.df.iloc[self.rng.choice(len(dataset.df), 5, replace=False)]
+            dataset.save_rows(rows[['Asset ID', 'Priority', 'Next_Maintenance']].assign(
+                Priority=self.rng.choice(['عالي', 'متوسط', 'منخفض'], 5),
+                Next_Maintenance=self.random_dates(5).to_numpy(),
+            ))
+        return operation
+    
+    def assert_bitmaps_match(self, operation):
+        index = self.dataset.bitmap_index
+        expected = BitmapIndex.build(self.dataset.df)
+        self.assertEqual(index.version, self.dataset.version, operation)
+        self.assertEqual(index.size, expected.size, operation)
+        for column in BITMAP_COLUMNS:
+            for value in self.dataset.df[column].dropna().unique():
+                np.testing.assert_array_equal(
+                    index.mask(column, [value]), expected.mask(column, [value]),
+                    err_msg=f"{operation}: {column}={value}"
+                )
+    
+    def assert_due_dates_match(self, operation):
+        index = self.dataset.due_index
+        expected = DueIndex.build(self.dataset.df)
+        self.assertEqual(index.version, self.dataset.version, operation)
+        np.testing.assert_array_equal(index.values, expected.values, err_msg=operation)
+        np.testing.assert_array_equal(index.dates, expected.dates, err_msg=operation)
+        # المواعيد المتساوية قد تختلف في ترتيب مواقعها
+        self.assertEqual(sorted(index.positions), sorted(expected.positions), operation)
+        np.testing.assert_array_equal(index.values[index.positions], index.dates, err_msg=operation)
+        for time_range in TIME_RANGES:
+            np.testing.assert_array_equal(
+                index.mask(time_range, self.today), expected.mask(time_range, self.today),
+                err_msg=f"{operation}: {time_range}"
+            )
+    
+    def test_random_writes_keep_indexes_in_sync(self):
+        self.assert_bitmaps_match('build')
+        self.assert_due_dates_match('build')
+        for _ in range(STEPS):
+            operation = self.random_operation()
+            self.assert_bitmaps_match(operation)
+            self.assert_due_dates_match(operation)
+
+if __name__ == '__main__':
+    unittest.main()